@@ -0,0 +1,44 @@
+"""only polls that are not closed yet in ix_polls_expires_at_open
+
+Revision ID: 3d9f6b2c8e15
+Revises: a5c81e2f4b67
+Create Date: 2026-10-18 21:14:37.519302
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3d9f6b2c8e15'
+down_revision: Union[str, None] = 'a5c81e2f4b67'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+OPEN = 'closed_at IS NULL AND expires_at IS NOT NULL'
+WITH_DEADLINE = 'expires_at IS NOT NULL'
+
+
+def rebuild(where: str) -> None:
+    # CONCURRENTLY, like c4e8b3f17a92, so the polls table stays writable
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_polls_expires_at_open', table_name='polls', postgresql_concurrently=True)
+        op.create_index(
+            'ix_polls_expires_at_open', 'polls', ['expires_at'],
+            postgresql_concurrently=True,
+            postgresql_where=sa.text(where),
+            sqlite_where=sa.text(where),
+        )
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # closed polls left the index, it no longer grows with the history
+    rebuild(OPEN)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    rebuild(WITH_DEADLINE)
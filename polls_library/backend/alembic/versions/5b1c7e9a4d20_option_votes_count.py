@@ -0,0 +1,36 @@
+"""options.votes_count tally
+
+Revision ID: 5b1c7e9a4d20
+Revises: 02680878b1e0
+Create Date: 2026-10-18 10:12:31.204518
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5b1c7e9a4d20'
+down_revision: Union[str, None] = '02680878b1e0'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('options',
+    sa.Column('votes_count', sa.Integer(), server_default='0', nullable=False)
+    )
+    # backfill from the existing votes, same as `python -m backend.tallies`
+    op.execute(
+        "UPDATE options SET votes_count = ("
+        "SELECT count(vote_option_links.vote_id) FROM vote_option_links "
+        "WHERE vote_option_links.option_id = options.id)"
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('options', 'votes_count')
@@ -0,0 +1,31 @@
+"""votes (voter_id, poll_id) unique
+
+Revision ID: 8f3a2d61c0b7
+Revises: 5b1c7e9a4d20
+Create Date: 2026-10-18 11:02:47.918330
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8f3a2d61c0b7'
+down_revision: Union[str, None] = '5b1c7e9a4d20'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # batch mode so the constraint can also be added on SQLite
+    with op.batch_alter_table('votes') as batch_op:
+        batch_op.create_unique_constraint('uq_votes_voter_id_poll_id', ['voter_id', 'poll_id'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table('votes') as batch_op:
+        batch_op.drop_constraint('uq_votes_voter_id_poll_id', type_='unique')
@@ -0,0 +1,33 @@
+"""shared rate limit buckets
+
+Revision ID: a5c81e2f4b67
+Revises: e71d9c05b3a8
+Create Date: 2026-10-18 19:02:14.208831
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a5c81e2f4b67'
+down_revision: Union[str, None] = 'e71d9c05b3a8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('rate_limit_buckets',
+    sa.Column('key', sa.String(length=255), nullable=False),
+    sa.Column('tat', sa.Float(), nullable=False),
+    sa.Column('allowed', sa.Boolean(), nullable=False),
+    sa.PrimaryKeyConstraint('key')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('rate_limit_buckets')
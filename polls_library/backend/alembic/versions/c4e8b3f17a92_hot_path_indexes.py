@@ -0,0 +1,47 @@
+"""indexes for the vote and option access paths
+
+Revision ID: c4e8b3f17a92
+Revises: 8f3a2d61c0b7
+Create Date: 2026-10-18 14:26:05.204117
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c4e8b3f17a92'
+down_revision: Union[str, None] = '8f3a2d61c0b7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# votes.voter_id is already covered by uq_votes_voter_id_poll_id
+# and vote_option_links.vote_id by the primary key
+INDEXES = [
+    ('ix_votes_poll_id_id', 'votes', ['poll_id', 'id'], {}),
+    ('ix_options_poll_id', 'options', ['poll_id'], {}),
+    ('ix_vote_option_links_option_id', 'vote_option_links', ['option_id'], {}),
+    ('ix_polls_author_id', 'polls', ['author_id'], {}),
+    ('ix_polls_expires_at_open', 'polls', ['expires_at'], {
+        'postgresql_where': sa.text('expires_at IS NOT NULL'),
+        'sqlite_where': sa.text('expires_at IS NOT NULL'),
+    }),
+]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # CONCURRENTLY doesn't lock writes on Postgres but can't run in a transaction.
+    # If a build fails it leaves an INVALID index, drop it before running again.
+    with op.get_context().autocommit_block():
+        for name, table, columns, kwargs in INDEXES:
+            op.create_index(name, table, columns, postgresql_concurrently=True, **kwargs)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        for name, table, columns, kwargs in reversed(INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True)
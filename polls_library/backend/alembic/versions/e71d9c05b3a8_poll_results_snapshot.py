@@ -0,0 +1,37 @@
+"""final results of closed polls
+
+Revision ID: e71d9c05b3a8
+Revises: c4e8b3f17a92
+Create Date: 2026-10-18 16:48:31.662054
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e71d9c05b3a8'
+down_revision: Union[str, None] = 'c4e8b3f17a92'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('polls', sa.Column('closed_at', sa.DateTime(), nullable=True))
+    op.create_table('poll_results',
+    sa.Column('poll_id', sa.Integer(), nullable=False),
+    sa.Column('closed_at', sa.DateTime(), nullable=False),
+    sa.Column('options', sa.JSON(), nullable=False),
+    sa.ForeignKeyConstraint(['poll_id'], ['polls.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('poll_id')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('poll_results')
+    with op.batch_alter_table('polls') as batch_op:
+        batch_op.drop_column('closed_at')
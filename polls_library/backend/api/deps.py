@@ -1,16 +1,58 @@
+import time
+from dataclasses import dataclass
 from typing import Annotated
 
 from fastapi import Depends, HTTPException
 from fastapi.requests import Request
+from sqlalchemy import event, select
 from sqlalchemy.orm import Session
 
+from ..cache import TTLCache
+from ..config import settings
 from ..exceptions import UserMissingException
 
-from ..database import get_db_session
+from ..database import get_db_session, sessionmanager
 from ..models.models import UserModel
+from ..rate_limit import GLOBAL_LIMIT, POLL_LIMIT, USER_LIMIT, rate_limiter, write_gate
 
 SessionDep = Annotated[Session, Depends(get_db_session)]
 
+
+def stick_to_primary(request: Request) -> None:
+    """Keeps the reads of the request's user on the primary for
+    READ_YOUR_WRITES_SECONDS, so replica lag doesn't hide what they just wrote.
+    Kept in the session cookie, so it holds on every worker."""
+    request.session["wrote_at"] = time.time()
+
+
+async def get_read_db_session(request: Request):
+    wrote_at = request.session.get("wrote_at")
+    if wrote_at and time.time() - wrote_at < settings.READ_YOUR_WRITES_SECONDS:
+        session_factory = sessionmanager.session
+    else:
+        session_factory = sessionmanager.read_session
+    async with session_factory() as session:
+        yield session
+
+ReadSessionDep = Annotated[Session, Depends(get_read_db_session)]
+
+
+@dataclass(frozen=True, slots=True)
+class UserPrincipal:
+    # the columns of UserModel, without its relationships or a session
+    id: str
+    is_superuser: bool
+    active: bool
+
+# keyed by session email, other workers see changes after USER_CACHE_TTL
+user_cache = TTLCache(settings.USER_CACHE_TTL, settings.USER_CACHE_SIZE)
+
+@event.listens_for(UserModel, "after_update")
+@event.listens_for(UserModel, "after_delete")
+def invalidate_user(mapper, connection, target: UserModel):
+    user_cache.pop(target.id)
+
+
 def get_current_user_on_client(request: Request):
     return request.session.get("user")
 
@@ -18,22 +60,72 @@ def get_current_user_on_client(request: Request):
 async def get_current_user_in_db(session: SessionDep, request: Request):
     user_on_client = get_current_user_on_client(request)
     if user_on_client:
-        user_in_db = await session.get(UserModel, user_on_client.get("email"))
-        if not user_in_db:
-            raise HTTPException(status_code=400, detail="Possible forged session cookie, user not found")
+        email = user_on_client.get("email")
+        user_in_db = user_cache.get(email)
+        if user_in_db is None:
+            row = (await session.execute(
+                select(UserModel.id, UserModel.is_superuser, UserModel.active)
+                .where(UserModel.id == email)
+            )).first()
+            if not row:
+                raise HTTPException(status_code=400, detail="Possible forged session cookie, user not found")
+            user_in_db = UserPrincipal(*row)
+            user_cache.set(email, user_in_db)
         if not user_in_db.active:
             raise HTTPException(status_code=400, detail="Inactive user")
         return user_in_db
     else:
         raise UserMissingException(403,'no user in session')
 
-CurrentUser = Annotated[UserModel, Depends(get_current_user_in_db)]
+CurrentUser = Annotated[UserPrincipal, Depends(get_current_user_in_db)]
 
-def get_current_active_superuser(request: Request, current_user: CurrentUser) -> UserModel:
+def get_current_active_superuser(request: Request, current_user: CurrentUser) -> UserPrincipal:
     if not current_user.is_superuser:
         raise HTTPException(
             status_code=403, detail="The user doesn't have enough privileges"
         )
     return current_user
 
-CurrentSuperuser = Annotated[UserModel, Depends(get_current_active_superuser)]
+CurrentSuperuser = Annotated[UserPrincipal, Depends(get_current_active_superuser)]
+
+
+async def check_rate_limit(user_id: str, poll_id: int | None = None) -> None:
+    """429 when the user, the poll or all users together write faster than
+    the RATE_LIMIT_* settings allow."""
+    retry_after = await rate_limiter.check(
+        (f"user:{user_id}", USER_LIMIT),
+        (f"poll:{poll_id}", POLL_LIMIT if poll_id is not None else None),
+        ("global", GLOBAL_LIMIT),
+    )
+    if retry_after:
+        raise HTTPException(
+            status_code=429, detail="Too many requests", headers={"Retry-After": str(retry_after)}
+        )
+
+async def limit_writes(current_user: CurrentUser) -> None:
+    await check_rate_limit(current_user.id)
+
+async def limit_votes(current_user: CurrentUser, request: Request) -> None:
+    #runs before FastAPI reports a bad body, which then gets its 422
+    try:
+        body = await request.json()
+    except ValueError:
+        body = None
+    poll_id = body.get("poll_id") if isinstance(body, dict) else None
+    await check_rate_limit(current_user.id, poll_id if isinstance(poll_id, int) else None)
+
+async def write_slot():
+    """Holds one of the worker's WRITE_MAX_CONCURRENCY slots during the request,
+    503 when none frees up within WRITE_QUEUE_TIMEOUT."""
+    if not await write_gate.acquire():
+        raise HTTPException(
+            status_code=503, detail="Too many writes in progress", headers={"Retry-After": "1"}
+        )
+    try:
+        yield
+    finally:
+        write_gate.release()
+
+# dependencies= of the write routes, the rate limits first so rejected requests don't take a slot
+WriteLimits = [Depends(limit_writes), Depends(write_slot)]
+VoteLimits = [Depends(limit_votes), Depends(write_slot)]
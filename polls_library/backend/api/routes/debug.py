@@ -2,6 +2,8 @@ from fastapi import APIRouter, Request
 from starlette.routing import Route
 
 from ..deps import CurrentUser, SessionDep
+from ...crud import CrudFactory
+from ...models.models import UserModel
 from ...schemas.schemas import UserSchema
 router = APIRouter(prefix="/debug", tags=["debug"])
 
@@ -12,7 +14,9 @@ async def read_current_user(
 ):
     #Check current user
 
-    return current_user
+    return await CrudFactory(UserModel).read(
+        session, current_user.id, load="user_with_polls_and_votes"
+    )
 
 @router.get("/routes")
 async def read_app_routes(request: Request):
@@ -1,16 +1,32 @@
-from fastapi import APIRouter
-from fastapi.responses import PlainTextResponse
+import json
+
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from sqlalchemy import select
 
 from ...config import settings
-from ...crud import CrudFactory
-from ...models.models import PollModel
+from ...counts import totals
+from ...crud import CrudFactory, ModelException
+from ...etags import (
+    cache_closed,
+    closed_response,
+    conditional_body,
+    conditional_response,
+    invalidate_poll,
+    not_modified,
+)
+from ...live import Subscription, live_hub
+from ...models.models import PollModel, PollResultsModel
+from ...serialization import dumps, polls_with_options
 from ...schemas.schemas import (
     PollCreateSchema,
     PollExtendedSchema,
     PollPublicSchema,
+    PollResultsSchema,
     PollsPublicSchema
 )
-from ..deps import SessionDep, CurrentSuperuser
+from ...tallies import read_tallies, recount_tallies
+from ..deps import ReadSessionDep, SessionDep, CurrentSuperuser, WriteLimits, stick_to_primary
 
 router = APIRouter(prefix="/polls", tags=["polls"])
 
@@ -18,47 +34,172 @@ PollCrud = CrudFactory(PollModel)
 
 @router.get("/", response_model=PollsPublicSchema)
 async def read_polls(
-    session: SessionDep, offset: int = 0
+    request: Request, session: ReadSessionDep, offset: int = 0, cursor: str | None = None
 ):
-    #Retrieve polls
-    data, count = await PollCrud.read_many(session,offset=offset, limit=offset+settings.BACKEND_PAGINATION_AMOUNT)
-    return PollsPublicSchema(
+    #Retrieve polls, pass the returned next_cursor to get the next page
+    key = ("polls", offset, cursor)
+    if response := not_modified(request, key):
+        return response
+    limit = settings.BACKEND_PAGINATION_AMOUNT
+    try:
+        data, count = await PollCrud.read_many(
+            session,
+            offset=offset or None,
+            limit=limit,
+            load="poll_with_options",
+            order_by="id",
+            cursor=cursor,
+            as_rows=settings.FAST_SERIALIZATION,
+        )
+    except ModelException:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if settings.FAST_SERIALIZATION:
+        return conditional_body(request, key, dumps({
+            "data": await polls_with_options(session, data),
+            "count": await totals.count(session, PollModel),
+            "next_cursor": PollCrud.cursor_of(data[-1]) if count == limit else None,
+        }))
+    return conditional_response(request, key, PollsPublicSchema, PollsPublicSchema(
         data=data,
-        count=count
-    )
+        count=await totals.count(session, PollModel),
+        next_cursor=PollCrud.cursor_of(data[-1]) if count == limit else None,
+    ))
 
 
 @router.get("/{id}", response_model=PollPublicSchema)
 async def read_poll(
-    session: SessionDep, id: int
+    request: Request, session: ReadSessionDep, id: int
 ):
     #Get poll by ID
-    poll = await PollCrud.read(session, id)
+    if response := closed_response(request, ("poll", id)):
+        return response
+    if response := not_modified(request, ("poll", id)):
+        return response
+    poll = await PollCrud.read(session, id, load="poll_with_options")
     if poll is None:
         return PlainTextResponse(None, 204)
-    return poll
+    if poll.closed_at is not None:
+        return cache_closed(request, ("poll", id), PollPublicSchema, poll)
+    return conditional_response(request, ("poll", id), PollPublicSchema, poll)
 
 
-@router.post("/", response_model=PollPublicSchema)
+@router.get("/{id}/results", response_model=PollResultsSchema)
+async def read_poll_results(
+    request: Request, session: SessionDep, id: int
+):
+    #Get per-option vote counts from the tallies, or the final results of a closed poll
+    if response := closed_response(request, ("results", id)):
+        return response
+    if response := not_modified(request, ("results", id)):
+        return response
+    options = await read_tallies(session, id, with_closed_at=True)
+    if not options:
+        return PlainTextResponse(None, 204)
+    #the snapshot is read once per worker, then closed_response answers
+    final = None
+    if options[0].closed_at is not None:
+        final = await session.scalar(select(PollResultsModel.options).where(PollResultsModel.poll_id == id))
+    if final is not None:
+        return cache_closed(request, ("results", id), PollResultsSchema, PollResultsSchema(
+            poll_id=id,
+            options=final
+        ))
+    return conditional_response(request, ("results", id), PollResultsSchema, PollResultsSchema(
+        poll_id=id,
+        options=options
+    ))
+
+
+async def live_results(request: Request, id: int, snapshot: str, subscription: Subscription):
+    try:
+        yield f"event: results\ndata: {snapshot}\n\n"
+        while not await request.is_disconnected():
+            counts = await subscription.next(settings.LIVE_HEARTBEAT_SECONDS)
+            if counts is None:
+                yield ": ping\n\n"
+                continue
+            yield f"event: tally\ndata: {json.dumps({'poll_id': id, 'options': counts})}\n\n"
+    finally:
+        live_hub.unsubscribe(id, subscription)
+
+
+@router.get("/{id}/live")
+async def read_poll_results_live(
+    request: Request, session: SessionDep, id: int
+):
+    #Server-Sent Events: the current results, then the new counts of changed options
+    subscription = live_hub.subscribe(id)
+    options = await read_tallies(session, id)
+    if not options:
+        live_hub.unsubscribe(id, subscription)
+        return PlainTextResponse(None, 204)
+    snapshot = PollResultsSchema(poll_id=id, options=options).model_dump_json()
+    return StreamingResponse(
+        live_results(request, id, snapshot, subscription),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.post("/{id}/results/recount", response_model=PollResultsSchema, dependencies=WriteLimits)
+async def recount_poll_results(
+    session: SessionDep, current_user: CurrentSuperuser, id: int
+):
+    #Rebuild the tallies of a poll from the stored votes
+    invalidate_poll(id)
+    if ( await recount_tallies(session, id) ) == 0:
+        return PlainTextResponse(None, 204)
+    return PollResultsSchema(
+        poll_id=id,
+        options=await read_tallies(session, id)
+    )
+
+
+@router.post("/", response_model=PollPublicSchema, dependencies=WriteLimits)
 async def create_poll(
-    *, session: SessionDep, current_user: CurrentSuperuser, poll_in: PollCreateSchema
+    *, request: Request, session: SessionDep, current_user: CurrentSuperuser, poll_in: PollCreateSchema
 ):
     #Create new poll
+    stick_to_primary(request)
     poll_processed = PollExtendedSchema(
         **(poll_in.model_dump() |
             {
                 "author_id":current_user.id
             }  
         ))
-    poll = await PollCrud.create_instance(session, poll_processed.model_dump())
+    (poll,) = await PollCrud.create_bulk(session, [poll_processed.model_dump()])
+    invalidate_poll(poll["id"], listings=True)
     return poll
 
 
-@router.delete("/{id}")
+@router.post("/bulk", response_model=PollsPublicSchema, dependencies=WriteLimits)
+async def create_polls_bulk(
+    *, request: Request, session: SessionDep, current_user: CurrentSuperuser, polls_in: list[PollCreateSchema]
+):
+    #Create many polls with their options in one transaction
+    if sum(len(poll_in.options) + 1 for poll_in in polls_in) > settings.BULK_MAX_ROWS:
+        raise HTTPException(status_code=413, detail=f"At most {settings.BULK_MAX_ROWS} polls and options per request")
+    stick_to_primary(request)
+    polls = await PollCrud.create_bulk(session, [
+        PollExtendedSchema(**(poll_in.model_dump() | {"author_id": current_user.id})).model_dump()
+        for poll_in in polls_in
+    ])
+    if polls:
+        #new polls have nothing cached themselves, this drops the listing pages
+        invalidate_poll(polls[0]["id"], listings=True)
+    return PollsPublicSchema(
+        data=polls,
+        count=len(polls)
+    )
+
+
+@router.delete("/{id}", dependencies=WriteLimits)
 async def delete_poll(
-    session: SessionDep, current_user: CurrentSuperuser, id: int
+    request: Request, session: SessionDep, current_user: CurrentSuperuser, id: int
 ):
     #Delete a poll
+    stick_to_primary(request)
+    invalidate_poll(id, listings=True)
     if ( await PollCrud.delete(session,id) ) == 1:
         return PlainTextResponse(None, 200)
     else:
@@ -3,17 +3,33 @@ from fastapi import APIRouter
 
 from ..deps import (
     CurrentUser,
+    SessionDep,
 )
 
+from ...config import settings
+from ...crud import CrudFactory
+from ...models.models import VoteModel
 from ...schemas.schemas import VotesPublicSchema
+from ...serialization import FastJSONResponse, votes_with_options
 
 
 router = APIRouter(prefix="/users", tags=["users"])
 
+VoteCrud = CrudFactory(VoteModel)
+
 @router.get("/votes", response_model=VotesPublicSchema)
-def read_user_votes(current_user: CurrentUser):
-    data = current_user.votes
+async def read_user_votes(session: SessionDep, current_user: CurrentUser):
+    data, count = await VoteCrud.read_many(
+        session, [current_user.id], column="voter_id", load="vote_with_options",
+        as_rows=settings.FAST_SERIALIZATION,
+    )
+    if settings.FAST_SERIALIZATION:
+        return FastJSONResponse({
+            "data": await votes_with_options(session, data),
+            "count": count,
+            "next_cursor": None
+        })
     return VotesPublicSchema(
         data=data,
-        count=len(data)
+        count=count
     )
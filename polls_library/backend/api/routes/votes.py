@@ -1,19 +1,46 @@
-from uuid import UUID
-from fastapi import APIRouter, HTTPException
-from fastapi.responses import PlainTextResponse
+import csv
+import io
+import json
+from typing import AsyncIterator, Literal
+from uuid import UUID, uuid4
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from datetime import datetime, timezone
+from pydantic import ValidationError
+from sqlalchemy import delete, insert, select
 
-from ...crud import CrudFactory
-from ..deps import CurrentUser, SessionDep
+from ...config import settings
+from ...counts import totals
+from ...crud import CrudFactory, ModelException, copy_insert, dialect_insert
+from ...database import sessionmanager
+from ...etags import cache_closed_body, closed_response, invalidate_poll
+from ...live import publish_tallies
+from ...poll_closer import has_expired
+from ...serialization import FastJSONResponse, dumps, votes_with_options
+from ...tallies import change_tallies, change_tallies_many
+from ...vote_buffer import vote_buffer
+from ..deps import (
+    CurrentSuperuser,
+    CurrentUser,
+    ReadSessionDep,
+    SessionDep,
+    VoteLimits,
+    WriteLimits,
+    stick_to_primary,
+)
 from ...models.models import (
     OptionModel,
     PollModel,
     UserModel,
     VoteModel,
+    VoteOptionLinksModel,
 )
 from ...schemas.schemas import (
+    VoteBulkCreateSchema,
+    VoteBulkResultSchema,
     VoteCreateSchema,
     VotePublicSchema,
+    VotesBulkResultSchema,
     VotesPublicSchema
 )
 
@@ -24,26 +51,131 @@ OptionCrud = CrudFactory(OptionModel)
 VoteCrud = CrudFactory(VoteModel)
 UserCrud = CrudFactory(UserModel)
 
+async def check_poll_not_anonymous(session: SessionDep, current_user: CurrentUser, poll_id: int):
+    if not current_user.is_superuser:
+        poll = await PollCrud.read(session, poll_id)
+        if poll and poll.anonymous:
+            raise HTTPException(403, "This poll is anonymous")
+
+
+async def export_votes(poll_id: int, format: str) -> AsyncIterator[str]:
+    #Own session: the request's SessionDep is closed before the body is streamed
+    query = (
+        select(VoteModel.id, VoteModel.voter_id, OptionModel.id, OptionModel.title)
+        .join(VoteOptionLinksModel, VoteOptionLinksModel.vote_id == VoteModel.id)
+        .join(OptionModel, OptionModel.id == VoteOptionLinksModel.option_id)
+        .where(VoteModel.poll_id == poll_id)
+        .order_by(VoteModel.id)
+        .execution_options(yield_per=settings.EXPORT_CHUNK_SIZE)
+    )
+    if format == "csv":
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(["vote_id", "poll_id", "voter_id", "option_id", "option_title"])
+    vote = None
+    async with sessionmanager.read_session() as session:
+        result = await session.stream(query)
+        async for rows in result.partitions():
+            chunk = []
+            for vote_id, voter_id, option_id, option_title in rows:
+                if format == "csv":
+                    writer.writerow([vote_id, poll_id, voter_id, option_id, option_title])
+                    continue
+                #one line per vote, rows of the same vote are consecutive
+                if vote is None or vote["id"] != str(vote_id):
+                    if vote is not None:
+                        chunk.append(json.dumps(vote) + "\n")
+                    vote = {"id": str(vote_id), "poll_id": poll_id, "voter_id": voter_id, "selected_options": []}
+                vote["selected_options"].append({"id": str(option_id), "title": option_title})
+            if format == "csv":
+                chunk.append(buffer.getvalue())
+                buffer.seek(0)
+                buffer.truncate()
+            if chunk:
+                yield "".join(chunk)
+    if format == "csv" and buffer.tell():
+        yield buffer.getvalue()
+    if vote is not None:
+        yield json.dumps(vote) + "\n"
+
+
+@router.get("/polls/{poll_id}/export")
+async def export_votes_by_poll(
+    session: SessionDep,
+    current_user: CurrentUser,
+    poll_id: int,
+    format: Literal["ndjson", "csv"] = "ndjson",
+):
+    #Stream every vote of a poll (by poll_id) in constant memory
+
+    #checking for an anonymous survey
+    await check_poll_not_anonymous(session, current_user, poll_id)
+
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        export_votes(poll_id, format),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="poll-{poll_id}-votes.{format}"'},
+    )
+
+
 @router.get("/polls/{poll_id}", response_model=VotesPublicSchema)
 async def read_votes_by_poll(
-    session: SessionDep,
+    request: Request,
+    session: ReadSessionDep,
     current_user: CurrentUser,
     poll_id: int,
     offset: int = 0,
+    cursor: str | None = None,
 ):
-    #Retrieve votes of a poll (by poll_id)
+    #Retrieve votes of a poll (by poll_id), pass the returned next_cursor to get the next page
+
+    #only pages of polls that aren't anonymous are cached, no check needed
+    key = ("votes", poll_id, offset, cursor)
+    if response := closed_response(request, key):
+        return response
 
+    poll = (await session.execute(
+        select(PollModel.anonymous, PollModel.closed_at).where(PollModel.id == poll_id)
+    )).first()
     #checking for an anonymous survey
-    if not current_user.is_superuser:
-        poll = await PollCrud.read(session, poll_id)
-        if poll.anonymous:
-            return HTTPException(403, "This poll is anonymous")
-        
-    data, count = await VoteCrud.read_many(session, [poll_id], column="poll_id")
-    return VotesPublicSchema(
-        data=data,
-        count=count
-    )
+    if poll and poll.anonymous and not current_user.is_superuser:
+        raise HTTPException(403, "This poll is anonymous")
+
+    limit = settings.BACKEND_PAGINATION_AMOUNT
+    try:
+        data, count = await VoteCrud.read_many(
+            session,
+            [poll_id],
+            offset=offset or None,
+            limit=limit,
+            column="poll_id",
+            load="vote_with_options",
+            order_by="id",
+            cursor=cursor,
+            as_rows=settings.FAST_SERIALIZATION,
+        )
+    except ModelException:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if settings.FAST_SERIALIZATION:
+        votes = {
+            "data": await votes_with_options(session, data),
+            "count": await totals.count(session, VoteModel, "poll_id", poll_id),
+            "next_cursor": VoteCrud.cursor_of(data[-1]) if count == limit else None,
+        }
+    else:
+        votes = VotesPublicSchema(
+            data=data,
+            count=await totals.count(session, VoteModel, "poll_id", poll_id),
+            next_cursor=VoteCrud.cursor_of(data[-1]) if count == limit else None,
+        )
+    if poll and poll.closed_at is not None and not poll.anonymous:
+        #the votes of a closed poll don't change anymore
+        body = dumps(votes) if settings.FAST_SERIALIZATION else votes.model_dump_json().encode()
+        return cache_closed_body(request, key, body, private=True)
+    if settings.FAST_SERIALIZATION:
+        return FastJSONResponse(votes)
+    return votes
 
 @router.get("/{id}", response_model=VotePublicSchema)
 async def read_vote(
@@ -51,7 +183,7 @@ async def read_vote(
     id: UUID
 ):
     #Get vote by ID
-    vote = await VoteCrud.read(session, id)
+    vote = await VoteCrud.read(session, id, load="vote_with_options")
     if vote is None:
         return PlainTextResponse(None, 204)
     
@@ -64,55 +196,269 @@ async def read_vote(
     
     return vote
 
-@router.delete("/{id}")
+@router.delete("/{id}", dependencies=WriteLimits)
 async def delete_vote(
+    request: Request,
     session: SessionDep, 
     current_user: CurrentUser, id: UUID
 ):
     #Delete a vote
-    if ( await VoteCrud.delete(session,id) ) == 1:
+    stick_to_primary(request)
+    vote = (await session.execute(
+        select(VoteModel.poll_id, PollModel.closed_at)
+        .join(PollModel, PollModel.id == VoteModel.poll_id)
+        .where(VoteModel.id == id)
+    )).first()
+    poll_id = vote.poll_id if vote else None
+    if vote and vote.closed_at is not None:
+        #the final results are frozen
+        raise HTTPException(status_code=400, detail="Voting for this poll has closed")
+
+    #only the links this transaction removed are counted down, a concurrent
+    #delete of the same vote finds none left
+    option_ids = (await session.scalars(
+        delete(VoteOptionLinksModel)
+        .where(VoteOptionLinksModel.vote_id == id)
+        .returning(VoteOptionLinksModel.option_id)
+    )).all()
+    deleted = (await session.execute(delete(VoteModel).where(VoteModel.id == id))).rowcount
+    if poll_id is not None and option_ids:
+        await publish_tallies(session, poll_id, await change_tallies(session, option_ids, -1))
+    await session.commit()
+    #after the commit, so a concurrent read can't cache the old tallies again
+    if poll_id is not None:
+        invalidate_poll(poll_id)
+    if deleted == 1:
         return PlainTextResponse(None, 200)
     else:
         return PlainTextResponse(None, 204)
 
 
-@router.post("/", response_model=VotePublicSchema, name="create_vote_api")
+@router.post("/", response_model=VotePublicSchema, name="create_vote_api", dependencies=VoteLimits)
 async def create_vote(
     *,
+    request: Request,
     session: SessionDep,
     current_user: CurrentUser,
     vote_in: VoteCreateSchema,
 ):
     #Create new vote
+    selected_options = list(dict.fromkeys(vote_in.selected_options))
+    if not selected_options:
+        raise HTTPException(status_code=400, detail="No options selected")
 
-    #checking for an existing voice
-    await session.refresh(current_user)
-    existing_vote= [vote for vote in current_user.votes if vote.poll_id==vote_in.poll_id]
-    if existing_vote:
-        raise HTTPException(status_code=400, detail="Already voted in this poll")
+    #poll state and the voted options in one query
+    rows = (await session.execute(
+        select(
+            PollModel.multiple_choice,
+            PollModel.expires_at,
+            OptionModel.id,
+            OptionModel.title,
+        )
+        .outerjoin(
+            OptionModel,
+            (OptionModel.poll_id == PollModel.id) & OptionModel.id.in_(selected_options),
+        )
+        .where(PollModel.id == vote_in.poll_id)
+    )).all()
+    if not rows:
+        raise HTTPException(status_code=404, detail="Poll not found")
+    poll = rows[0]
 
     #checking for the existence of options
-    options, count = await OptionCrud.read_many(session, vote_in.selected_options)
-    if count!=len(vote_in.selected_options):
+    options = [{"id": row.id, "title": row.title} for row in rows if row.id is not None]
+    if len(options)!=len(selected_options):
         raise HTTPException(status_code=404, detail="One or multiple options voted for are not found")
-    
+
     #checking for a survey with multiple responses
-    if count>1 and not (await PollCrud.read(session, vote_in.poll_id)).multiple_choice:
+    if len(options)>1 and not poll.multiple_choice:
         raise HTTPException(status_code=400, detail="This poll is not multiple choice")
 
     #сhecking the validity period
-    poll = await PollCrud.read(session, vote_in.poll_id)
-    if poll.expires_at and poll.expires_at < datetime.now(timezone.utc):
+    if has_expired(poll.expires_at, datetime.now(timezone.utc)):
         raise HTTPException(status_code=400, detail="Voting for this poll has closed")
 
-    vote = await VoteCrud.create_instance(
-        session,
-        vote_in.model_dump(exclude="selected_options") | {"voter_id": current_user.id},
-        False,
+    #checking for an existing voice, the unique constraint makes it race-free
+    if vote_buffer.running:
+        #committed together with other votes, the request session only read
+        await session.rollback()
+        vote_id = uuid4()
+        if not await vote_buffer.submit(vote_id, current_user.id, vote_in.poll_id, selected_options):
+            vote_id = None
+    else:
+        vote_id = await session.scalar(
+            dialect_insert(session, VoteModel)
+            .values(voter_id=current_user.id, poll_id=vote_in.poll_id)
+            .on_conflict_do_nothing(index_elements=["voter_id", "poll_id"])
+            .returning(VoteModel.id)
+        )
+    if vote_id is None:
+        raise HTTPException(status_code=400, detail="Already voted in this poll")
+    stick_to_primary(request)
+
+    if not vote_buffer.running:
+        await session.execute(
+            insert(VoteOptionLinksModel),
+            [{"vote_id": vote_id, "option_id": option["id"]} for option in options],
+        )
+        counts = await change_tallies(session, selected_options)
+        await publish_tallies(session, vote_in.poll_id, counts)
+        await session.commit()
+    totals.invalidate(VoteModel)
+    invalidate_poll(vote_in.poll_id)
+    return VotePublicSchema(
+        id=vote_id,
+        poll_id=vote_in.poll_id,
+        voter_id=current_user.id,
+        selected_options=options,
     )
 
-    vote.selected_options = options
-    session.add(vote)
+
+async def read_bulk_items(request: Request):
+    """Parses the body of POST /votes/bulk while reading it, 413 as soon as
+    it exceeds BULK_MAX_BODY_BYTES or, for NDJSON, BULK_MAX_ROWS lines."""
+    too_large = HTTPException(status_code=413, detail=f"At most {settings.BULK_MAX_BODY_BYTES} bytes per request")
+    too_many = HTTPException(status_code=413, detail=f"At most {settings.BULK_MAX_ROWS} votes per request")
+    if int(request.headers.get("content-length") or 0) > settings.BULK_MAX_BODY_BYTES:
+        raise too_large
+    ndjson = request.headers.get("content-type", "").startswith("application/x-ndjson")
+    chunks, size, items, rest = [], 0, [], b""
+    async for chunk in request.stream():
+        size += len(chunk)
+        if size > settings.BULK_MAX_BODY_BYTES:
+            raise too_large
+        if not ndjson:
+            chunks.append(chunk)
+            continue
+        *lines, rest = (rest + chunk).split(b"\n")
+        items.extend(json.loads(line.decode()) for line in lines if line.strip())
+        if len(items) > settings.BULK_MAX_ROWS:
+            raise too_many
+    if not ndjson:
+        return json.loads(b"".join(chunks).decode())
+    if rest.strip():
+        items.append(json.loads(rest.decode()))
+    return items
+
+
+@router.post("/bulk", response_model=VotesBulkResultSchema, dependencies=WriteLimits)
+async def create_votes_bulk(
+    *,
+    request: Request,
+    session: SessionDep,
+    current_user: CurrentSuperuser,
+    create_voters: bool = False,
+):
+    #Import votes collected offline, body is a JSON list or NDJSON (application/x-ndjson)
+    try:
+        items = await read_bulk_items(request)
+    except ValueError as e:
+        #UnicodeDecodeError included
+        raise HTTPException(status_code=400, detail=f"Invalid body: {e}")
+    if not isinstance(items, list):
+        raise HTTPException(status_code=400, detail="Expected a list of votes")
+    if len(items) > settings.BULK_MAX_ROWS:
+        raise HTTPException(status_code=413, detail=f"At most {settings.BULK_MAX_ROWS} votes per request")
+
+    results = [VoteBulkResultSchema(index=i, accepted=False) for i in range(len(items))]
+    votes: dict[int, VoteBulkCreateSchema] = {}
+    for i, item in enumerate(items):
+        try:
+            votes[i] = VoteBulkCreateSchema.model_validate(item)
+        except ValidationError as e:
+            results[i].detail = "; ".join(
+                f"{'.'.join(map(str, error['loc']))}: {error['msg']}" for error in e.errors()
+            )
+
+    #set-wise lookups of everything the rows refer to
+    poll_ids = {vote.poll_id for vote in votes.values()}
+    voter_ids = {vote.voter_id for vote in votes.values()}
+    option_ids = {option_id for vote in votes.values() for option_id in vote.selected_options}
+    polls = {
+        row.id: row for row in await session.execute(
+            select(PollModel.id, PollModel.multiple_choice, PollModel.expires_at)
+            .where(PollModel.id.in_(poll_ids))
+        )
+    }
+    options = dict((await session.execute(
+        select(OptionModel.id, OptionModel.poll_id).where(OptionModel.id.in_(option_ids))
+    )).all())
+    voted = set((await session.execute(
+        select(VoteModel.voter_id, VoteModel.poll_id)
+        .where(VoteModel.voter_id.in_(voter_ids), VoteModel.poll_id.in_(poll_ids))
+    )).all())
+    voters = set((await session.scalars(
+        select(UserModel.id).where(UserModel.id.in_(voter_ids))
+    )).all())
+
+    now = datetime.now(timezone.utc)
+    vote_rows, link_rows, new_voters, amounts = [], [], set(), {}
+    for i, vote in votes.items():
+        selected_options = list(dict.fromkeys(vote.selected_options))
+        poll = polls.get(vote.poll_id)
+        if not selected_options:
+            results[i].detail = "No options selected"
+        elif poll is None:
+            results[i].detail = "Poll not found"
+        elif any(options.get(option_id) != vote.poll_id for option_id in selected_options):
+            results[i].detail = "One or multiple options voted for are not found"
+        elif len(selected_options)>1 and not poll.multiple_choice:
+            results[i].detail = "This poll is not multiple choice"
+        elif has_expired(poll.expires_at, now):
+            results[i].detail = "Voting for this poll has closed"
+        elif vote.voter_id not in voters and not create_voters:
+            results[i].detail = "Voter not found"
+        elif (vote.voter_id, vote.poll_id) in voted:
+            results[i].detail = "Already voted in this poll"
+        else:
+            voted.add((vote.voter_id, vote.poll_id))
+            if vote.voter_id not in voters:
+                new_voters.add(vote.voter_id)
+            results[i].id = uuid4()
+            vote_rows.append({"id": results[i].id, "voter_id": vote.voter_id, "poll_id": vote.poll_id})
+            for option_id in selected_options:
+                link_rows.append({"vote_id": results[i].id, "option_id": option_id})
+                amounts[option_id] = amounts.get(option_id, 0) + 1
+
+    if new_voters:
+        await session.execute(
+            dialect_insert(session, UserModel).on_conflict_do_nothing(),
+            [{"id": voter_id} for voter_id in new_voters],
+        )
+    if vote_rows:
+        #a concurrent vote of the same user may still win, those rows are skipped
+        inserted = set((await session.scalars(
+            dialect_insert(session, VoteModel)
+            .on_conflict_do_nothing(index_elements=["voter_id", "poll_id"])
+            .returning(VoteModel.id),
+            vote_rows,
+        )).all())
+        if len(inserted) != len(vote_rows):
+            for result in results:
+                if result.id is not None and result.id not in inserted:
+                    result.id = None
+                    result.detail = "Already voted in this poll"
+            skipped = {row["vote_id"] for row in link_rows} - inserted
+            for row in link_rows:
+                if row["vote_id"] in skipped:
+                    amounts[row["option_id"]] -= 1
+            link_rows = [row for row in link_rows if row["vote_id"] not in skipped]
+        await copy_insert(session, VoteOptionLinksModel, link_rows)
+        counts = await change_tallies_many(session, {k: v for k, v in amounts.items() if v})
+        for poll_id in {options[option_id] for option_id in counts}:
+            await publish_tallies(session, poll_id, {
+                option_id: count for option_id, count in counts.items() if options[option_id] == poll_id
+            })
     await session.commit()
-    await session.refresh(vote)
-    return vote
\ No newline at end of file
+    totals.invalidate(VoteModel)
+    for row in vote_rows:
+        invalidate_poll(row["poll_id"])
+
+    for result in results:
+        result.accepted = result.id is not None
+    accepted = sum(result.accepted for result in results)
+    return VotesBulkResultSchema(
+        data=results,
+        accepted=accepted,
+        rejected=len(results) - accepted,
+    )
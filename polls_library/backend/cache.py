@@ -0,0 +1,45 @@
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Iterator
+
+
+class TTLCache:
+    """Per-worker dict with a time to live and least recently used eviction.
+
+    Nothing is shared between gunicorn workers, so callers must be fine
+    with other workers serving a value for up to `ttl` seconds after it
+    was invalidated here.
+    """
+
+    def __init__(self, ttl: float, maxsize: int = 10_000):
+        self._ttl = ttl
+        self._maxsize = maxsize
+        self._values: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        cached = self._values.get(key)
+        if cached is None:
+            return default
+        if cached[0] <= time.monotonic():
+            del self._values[key]
+            return default
+        self._values.move_to_end(key)
+        return cached[1]
+
+    def set(self, key: Hashable, value: Any) -> None:
+        self._values[key] = (time.monotonic() + self._ttl, value)
+        self._values.move_to_end(key)
+        while len(self._values) > self._maxsize:
+            self._values.popitem(last=False)
+
+    def pop(self, key: Hashable) -> None:
+        self._values.pop(key, None)
+
+    def keys(self) -> Iterator[Hashable]:
+        return iter(list(self._values))
+
+    def clear(self) -> None:
+        self._values.clear()
+
+    def __len__(self) -> int:
+        return len(self._values)
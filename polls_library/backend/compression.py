@@ -0,0 +1,139 @@
+"""Compression of the response bodies (COMPRESSION_* settings).
+
+JSON lists and the polls page are mostly repeated keys and UUIDs and
+shrink to a fraction. Only bodies sent in one piece are compressed:
+StreamingResponse (SSE results, exports) passes through unchanged, so
+live updates aren't held back in a compressor's buffer.
+`python -m benchmarks.compression` shows the sizes and CPU cost.
+"""
+import gzip
+import threading
+from typing import Callable
+
+import anyio
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .config import settings
+
+try:
+    import brotli
+except ImportError:  # "performance" dependency group
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # "performance" dependency group
+    zstandard = None
+
+# larger bodies are compressed in a thread, the codecs release the GIL
+THREAD_THRESHOLD = 256 * 1024
+
+
+def available_encoders() -> dict[str, Callable[[bytes], bytes]]:
+    """Content-Encoding -> compress function at the configured level, for
+    the installed codecs."""
+    encoders = {
+        "gzip": lambda body: gzip.compress(body, compresslevel=settings.COMPRESSION_GZIP_LEVEL, mtime=0),
+    }
+    if brotli is not None:
+        encoders["br"] = lambda body: brotli.compress(body, quality=settings.COMPRESSION_BROTLI_QUALITY)
+    if zstandard is not None:
+        encoders["zstd"] = zstd_compress
+    return encoders
+
+
+# a ZstdCompressor isn't thread-safe, large bodies are compressed in threads
+_zstd = threading.local()
+
+
+def zstd_compress(body: bytes) -> bytes:
+    compressor = getattr(_zstd, "compressor", None)
+    if compressor is None:
+        compressor = _zstd.compressor = zstandard.ZstdCompressor(level=settings.COMPRESSION_ZSTD_LEVEL)
+    return compressor.compress(body)
+
+
+def accepted_encodings(accept_encoding: str) -> dict[str, float]:
+    """q-values of an Accept-Encoding header."""
+    accepted = {}
+    for item in accept_encoding.lower().split(","):
+        coding, _, params = item.strip().partition(";")
+        if not coding:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[coding.strip()] = q
+    return accepted
+
+
+class CompressionMiddleware:
+    """Compresses complete responses of `content_types` of at least
+    `minimum_size` bytes, with the first of `encodings` the client accepts."""
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        minimum_size: int = 1024,
+        content_types: tuple[str, ...] = ("application/json", "text/html"),
+        encodings: tuple[str, ...] = ("zstd", "br", "gzip"),
+    ):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.content_types = content_types
+        encoders = available_encoders()
+        self.encoders = {coding: encoders[coding] for coding in encodings if coding in encoders}
+
+    def choose(self, scope: Scope) -> str | None:
+        accepted = accepted_encodings(Headers(scope=scope).get("accept-encoding", ""))
+        for coding in self.encoders:
+            if accepted.get(coding, accepted.get("*", 0)) > 0:
+                return coding
+        return None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        coding = self.choose(scope)
+        start: Message | None = None
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal start
+            if message["type"] == "http.response.start":
+                # held back until the body shows whether it comes in one piece
+                start = message
+                return
+            if message["type"] != "http.response.body" or start is None:
+                await send(message)
+                return
+            response_start, start = start, None
+            headers = MutableHeaders(scope=response_start)
+            body = message.get("body", b"")
+            content_type = headers.get("content-type", "").partition(";")[0].strip()
+            if content_type not in self.content_types or "content-encoding" in headers:
+                await send(response_start)
+                await send(message)
+                return
+            headers.add_vary_header("Accept-Encoding")
+            if coding is None or message.get("more_body", False) or len(body) < self.minimum_size:
+                await send(response_start)
+                await send(message)
+                return
+            encode = self.encoders[coding]
+            if len(body) >= THREAD_THRESHOLD:
+                compressed = await anyio.to_thread.run_sync(encode, body)
+            else:
+                compressed = encode(body)
+            headers["Content-Encoding"] = coding
+            headers["Content-Length"] = str(len(compressed))
+            await send(response_start)
+            await send({"type": "http.response.body", "body": compressed})
+
+        await self.app(scope, receive, send_wrapper)
@@ -24,9 +24,66 @@ class Settings(BaseSettings):
     DEBUG_ECHO_SQL: bool = False
     DEBUG_REDIRECT_APIV1: bool = True
     DEBUG_USE_SQLITE: bool = True
+    DEBUG_QUERY_STATS: bool = True # X-DB-* headers and query logging, see backend/query_stats.py
+    DEBUG_REPEATED_QUERY_THRESHOLD: int = 10 # warn when a statement runs more often per request, 0 disables
 
     # BACKEND SETTINGS
     BACKEND_PAGINATION_AMOUNT: int = 100
+    COUNT_CACHE_TTL: float = 5 # seconds
+    COUNT_USE_ESTIMATES: bool = False # Postgres only, uses pg_class.reltuples
+    COUNT_ESTIMATE_MIN_ROWS: int = 1_000_000
+    EXPORT_CHUNK_SIZE: int = 1000 # rows fetched per round trip by streaming exports
+    BULK_MAX_ROWS: int = 10_000 # votes per POST /votes/bulk, polls and options per POST /polls/bulk
+    BULK_MAX_BODY_BYTES: int = 8 * 1024 * 1024 # size of a POST /votes/bulk body, checked while it is read
+    USER_CACHE_TTL: float = 30 # seconds a worker trusts its cached user row
+    USER_CACHE_SIZE: int = 10_000
+    ETAG_CACHE_TTL: float = 5 # seconds a worker answers If-None-Match from memory
+    ETAG_CACHE_SIZE: int = 10_000
+    VOTE_BATCHING: bool = False # commit votes in batches, see backend/vote_buffer.py
+    VOTE_BATCH_SIZE: int = 200
+    VOTE_BATCH_DELAY_MS: float = 5
+    LIVE_HEARTBEAT_SECONDS: float = 15 # keep-alive comment on idle /polls/{id}/live streams
+    METRICS_ENABLED: bool = True # request metrics on /metrics, see backend/metrics.py
+    DB_POOL_SIZE: int = 5 # connections kept open per worker
+    DB_MAX_OVERFLOW: int = 10 # extra connections per worker under load
+    DB_POOL_TIMEOUT: float = 30 # seconds to wait for a free connection
+    DB_POOL_RECYCLE: int = -1 # seconds before a connection is replaced, -1 never
+    DB_POOL_PRE_PING: bool = False # test connections on checkout
+    DB_STATEMENT_CACHE_SIZE: int = 100 # asyncpg prepared statements per connection, 0 for pgbouncer
+    DB_CONNECTION_BUDGET: int = 0 # connections for all workers together, overrides the pool size when set
+    WEB_CONCURRENCY: int = 1 # number of workers sharing DB_CONNECTION_BUDGET, set by docker-entrypoint.sh
+    DB_REPLICA_URLS: list[str] = [] # read-only replicas for the listing endpoints, as a JSON list
+    READ_YOUR_WRITES_SECONDS: float = 5 # reads of a user stay on the primary for this long after they wrote
+    POLL_CLOSE_INTERVAL: float = 30 # seconds between checks for expired polls, see backend/poll_closer.py
+    POLL_CLOSE_GRACE_SECONDS: float = 5 # votes accepted just before expires_at may still be committing
+    CLOSED_POLL_MAX_AGE: int = 3600 # Cache-Control max-age of closed polls and their results
+    SQLITE_SYNCHRONOUS: Literal["OFF", "NORMAL", "FULL"] = "NORMAL" # NORMAL is durable in WAL mode except on power loss
+    SQLITE_BUSY_TIMEOUT_MS: int = 5000 # wait for the write lock of other processes
+    SQLITE_MMAP_SIZE: int = 256 * 1024 * 1024 # bytes of the database file read through mmap
+    SQLITE_CACHE_SIZE_KB: int = 64 * 1024 # page cache per connection
+    SQLITE_SINGLE_WRITER: bool = True # queue the writes of a worker in asyncio, see backend/sqlite_profile.py
+    FAST_SERIALIZATION: bool = False # list endpoints encode rows to JSON directly, see backend/serialization.py
+    RATE_LIMIT_ENABLED: bool = True # token buckets of the write endpoints, see backend/rate_limit.py
+    RATE_LIMIT_BACKEND: Literal["memory", "database"] = "memory" # "database" shares the buckets between workers
+    RATE_LIMIT_USER_PER_SECOND: float = 2 # writes per user, 0 disables
+    RATE_LIMIT_USER_BURST: int = 20
+    RATE_LIMIT_POLL_PER_SECOND: float = 0 # votes per poll, 0 disables
+    RATE_LIMIT_POLL_BURST: int = 1000
+    RATE_LIMIT_GLOBAL_PER_SECOND: float = 0 # writes of all users together, 0 disables
+    RATE_LIMIT_GLOBAL_BURST: int = 1000
+    WRITE_MAX_CONCURRENCY: int = 0 # writes handled at once per worker, 0 for DB_POOL_SIZE (or its share of the budget)
+    WRITE_QUEUE_TIMEOUT: float = 1 # seconds a write waits for a slot before a 503
+    FRAGMENT_CACHE_TTL: float = 600 # seconds a worker keeps the rendered HTML of a poll
+    FRAGMENT_CACHE_SIZE: int = 10_000
+    JINJA_BYTECODE_CACHE: bool = True # share compiled templates between workers and restarts
+    JINJA_BYTECODE_CACHE_DIR: str | None = None # default: a directory in the system temp dir
+    COMPRESSION_ENABLED: bool = True # compress JSON and HTML responses, see backend/compression.py
+    COMPRESSION_MINIMUM_SIZE: int = 1024 # bytes, smaller bodies aren't worth it
+    COMPRESSION_CONTENT_TYPES: list[str] = ["application/json", "text/html"]
+    COMPRESSION_ENCODINGS: list[str] = ["zstd", "br", "gzip"] # server preference, zstd and br need the "performance" group
+    COMPRESSION_GZIP_LEVEL: int = 6 # 1-9
+    COMPRESSION_BROTLI_QUALITY: int = 4 # 0-11, above 5 gets slow for dynamic responses
+    COMPRESSION_ZSTD_LEVEL: int = 3 # 1-22
 
     # DEPLOY SETTINGS
     HTTPS: bool = True
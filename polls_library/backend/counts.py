@@ -0,0 +1,90 @@
+from typing import Any
+
+from sqlalchemy import func, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .cache import TTLCache
+from .config import settings
+from .models.models import BaseModel
+
+
+class TotalCounts:
+    """Per-worker cache of `SELECT count(*)` results.
+
+    Keys are (table, column, value), so both whole tables and filtered
+    counts like the votes of one poll can be cached. Entries live for
+    `ttl` seconds and are dropped early by `invalidate`, which CrudFactory
+    calls on create/delete. Other workers only see changes after the TTL.
+    """
+
+    def __init__(self, ttl: float, maxsize: int = 10_000):
+        self._values = TTLCache(ttl, maxsize)
+
+    async def count(
+        self,
+        session: AsyncSession,
+        model: type[BaseModel],
+        column: str | None = None,
+        value: Any = None,
+        estimate: bool = settings.COUNT_USE_ESTIMATES,
+    ) -> int:
+        """Returns the number of rows of `model`, or of the rows where
+        `column` == `value`, from the cache when possible.
+
+        Args:
+            session (AsyncSession): SQLAlchemy async session
+            model (type[BaseModel]): model of the counted table
+            column (str, optional): column to filter on. Defaults to None.
+            value (Any, optional): value of `column`. Defaults to None.
+            estimate (bool, optional): on Postgres, answer unfiltered counts
+                from the planner's `pg_class.reltuples` when the table has at
+                least COUNT_ESTIMATE_MIN_ROWS rows. Defaults to
+                COUNT_USE_ESTIMATES.
+
+        Returns:
+            int: amount of rows
+        """
+        key = (model.__tablename__, column, value)
+        cached = self._values.get(key)
+        if cached is not None:
+            return cached
+
+        total = None
+        if estimate and column is None and session.bind.dialect.name == "postgresql":
+            total = await self._estimate(session, model)
+        if total is None:
+            q = select(func.count()).select_from(model)
+            if column is not None:
+                q = q.where(getattr(model, column) == value)
+            total = await session.scalar(q)
+
+        self._values.set(key, total)
+        return total
+
+    async def _estimate(self, session: AsyncSession, model: type[BaseModel]) -> int | None:
+        reltuples = await session.scalar(
+            text("SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(:table)"),
+            {"table": model.__tablename__},
+        )
+        # -1 until the table was analyzed, and small tables are cheap to count
+        if reltuples is None or reltuples < settings.COUNT_ESTIMATE_MIN_ROWS:
+            return None
+        return reltuples
+
+    def invalidate(self, model: type[BaseModel]) -> None:
+        """Drops the cached counts of `model` and of every table whose rows
+        are removed with it by ON DELETE CASCADE."""
+        tables = {model.__table__}
+        for table in model.metadata.sorted_tables:
+            if any(fk.column.table in tables for fk in table.foreign_keys):
+                tables.add(table)
+        names = {table.name for table in tables}
+        for key in self._values.keys():
+            if key[0] in names:
+                self._values.pop(key)
+
+    def clear(self) -> None:
+        self._values.clear()
+
+
+totals = TotalCounts(settings.COUNT_CACHE_TTL)
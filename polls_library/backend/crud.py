@@ -1,15 +1,21 @@
 #https://github.com/LTMullineux/fastapi-snippets/blob/main/01-sqlalchemy-pydantic-crud-factory-pattern/snippets/crud.py
 
+import binascii
+import functools
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
 from typing import Any, TypeVar
 from uuid import UUID
 
-from sqlalchemy import delete, inspect, select
+from sqlalchemy import delete, insert, inspect, select
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import ONETOMANY, selectinload
 
+from .counts import totals
 from .schemas.schemas import BaseSchema
 
-from .models.models import BaseModel
+from .models.models import BaseModel, OptionModel, PollModel, UserModel, VoteModel
 
 class ModelException(Exception):
     pass
@@ -22,9 +28,124 @@ class NotFoundException(Exception):
 
 T = TypeVar('T', bound=BaseModel)
 
+# Relationships are lazy="raise", so every read declares what it needs by name
+LOADER_PROFILES = {
+    "poll_with_options": (
+        selectinload(PollModel.options),
+    ),
+    "vote_with_options": (
+        selectinload(VoteModel.selected_options),
+    ),
+    "user_with_polls_and_votes": (
+        selectinload(UserModel.polls).selectinload(PollModel.options),
+        selectinload(UserModel.votes).selectinload(VoteModel.selected_options),
+    ),
+    "option_with_poll": (
+        selectinload(OptionModel.poll),
+    ),
+}
+
+def loader_options(load: str | None):
+    if load is None:
+        return ()
+    try:
+        return LOADER_PROFILES[load]
+    except KeyError:
+        raise ModelException(f"Loader profile {load} not found.")
+
+def encode_cursor(value: Any) -> str:
+    """Opaque keyset pagination token for the last seen `order_by` value."""
+    if isinstance(value, UUID):
+        value = str(value)
+    return urlsafe_b64encode(json.dumps(value).encode()).decode()
+
+def decode_cursor(cursor: str) -> Any:
+    try:
+        return json.loads(urlsafe_b64decode(cursor.encode()))
+    except (ValueError, binascii.Error):
+        raise ModelException(f"Invalid cursor {cursor}.")
+
+def dialect_insert(session: AsyncSession, model: type[T]):
+    """Returns the dialect specific insert() of the session's database, which
+    unlike the generic one supports `on_conflict_do_nothing`/`on_conflict_do_update`.
+    """
+    if session.bind.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(model)
+
+async def copy_insert(session: AsyncSession, model: type[T], rows: list[dict[str, Any]]) -> None:
+    """Inserts plain rows in the session's transaction without building ORM objects.
+
+    Uses COPY on postgresql+asyncpg and a single executemany elsewhere. COPY
+    can't skip conflicts, so only use it for rows that can't conflict.
+    """
+    if not rows:
+        return
+    if session.bind.dialect.driver == "asyncpg":
+        columns = list(rows[0])
+        connection = await session.connection()
+        raw_connection = await connection.get_raw_connection()
+        await raw_connection.driver_connection.copy_records_to_table(
+            model.__tablename__,
+            records=[tuple(row[c] for c in columns) for row in rows],
+            columns=columns,
+        )
+    else:
+        await session.execute(insert(model), rows)
+
+@functools.cache
 def CrudFactory(model: type[T]):
+    """Returns the CRUD class of `model`, built once per model: the mapper
+    walk and the base statements are shared by every call."""
+    mapper = inspect(model)
+    columns = {column.key: column for column in mapper.columns}
+    relationships = {rel.key: rel for rel in mapper.relationships}
+    # generative, every .where() returns a new statement
+    select_model = select(model)
+    select_rows = select(*model.__table__.columns)
+    # RETURNING rows in the order of the executemany parameters
+    insert_returning = insert(model).returning(*model.__table__.columns, sort_by_parameter_order=True)
+    delete_model = delete(model)
+
+    def column_of(column: str):
+        try:
+            return getattr(model, column)
+        except AttributeError:
+            raise ModelException(
+                f"Column {column} not found on {model.__tablename__}.",
+            )
+
     class AsyncCrud[T]:
 
+        @classmethod
+        def build(cls, data: dict[str, Any]) -> T:
+            """Maps a (nested) data dictionary to an unsaved SQLAlchemy model.
+
+            Args:
+                data (dict[str, Any]): column values, and lists or dictionaries
+                    for the relationships
+
+            Returns:
+                T: SQLAlchemy model, not added to any session
+            """
+            instance_data = {}
+            for key, value in (data or {}).items():
+                if key in columns:
+                    instance_data[key] = value
+                elif key in relationships:
+                    rel = relationships[key]
+                    # cached, but not resolved upfront: PollModel and OptionModel refer to each other
+                    RelatedCrud = CrudFactory(rel.mapper.class_)
+                    if isinstance(value, list):
+                        instance_data[key] = [RelatedCrud.build(v) for v in value if v is not None]
+                    elif value is not None:
+                        instance_data[key] = RelatedCrud.build(value)
+                    else:
+                        instance_data[key] = [] if rel.uselist else None
+            return model(**instance_data)
+
         @classmethod
         async def create_instance(
             cls,
@@ -47,32 +168,14 @@ def CrudFactory(model: type[T]):
             Example:
                 hero = create_instance(Hero, {"name": "Jason", "secret_name": "Tree"})
             """
-            mapper = inspect(model)
-            columns = {column.key: column for column in mapper.columns}
-            relationships = {rel.key: rel for rel in mapper.relationships}
-
-            instance_data = {}
-            for key, value in (data or {}).items():
-                if key in columns:
-                    instance_data[key] = value
-                elif key in relationships:
-                    related_model = relationships[key].mapper.class_
-                    RelatedCrud=CrudFactory(related_model)
-                    if isinstance(value, list):
-                        instance_data[key] = [
-                            (await RelatedCrud.create_instance(session, v, False)) for v in value if v is not None
-                        ]
-                    elif value is not None:
-                        instance_data[key] = await RelatedCrud.create_instance(session, value, False)
-                    else:
-                        instance_data[key] = [] if relationships[key].uselist else None
-
-            db_model = model(**instance_data)
+            db_model = cls.build(data)
             if instantiate:
                 try:
                     session.add(db_model)
                     await session.commit()
-                    await session.refresh(db_model)
+                    totals.invalidate(model)
+                    # columns only, the nested relationships were just built in memory
+                    await session.refresh(db_model, list(columns))
                     return db_model
                 except IntegrityError:
                     raise IntegrityConflictException(
@@ -106,6 +209,7 @@ def CrudFactory(model: type[T]):
                 db_model = model(**data.model_dump())
                 session.add(db_model)
                 await session.commit()
+                totals.invalidate(model)
                 await session.refresh(db_model)
                 return db_model
             except IntegrityError:
@@ -115,6 +219,71 @@ def CrudFactory(model: type[T]):
             except Exception as e:
                 raise ModelException(f"Unknown error occurred: {e}") from e
 
+        @classmethod
+        async def create_bulk(
+            cls,
+            session: AsyncSession,
+            data: list[dict[str, Any]],
+            commit: bool = True,
+        ) -> list[dict[str, Any]]:
+            """Inserts (nested) data dictionaries with one multi-row INSERT ..
+            RETURNING per table instead of the unit of work, and returns the
+            created rows as dictionaries, so no refresh is needed.
+
+            The one-to-many relationships in `data` are inserted the same way
+            after their parents, with the foreign keys taken from the returned
+            parent rows. A poll with thousands of options takes two statements
+            (the driver splits very large ones into batches).
+
+            Args:
+                session (AsyncSession): SQLAlchemy async session
+                data (list[dict[str, Any]]): column values, and lists of
+                    dictionaries for the one-to-many relationships. Every
+                    dictionary of a level needs the same keys.
+                commit (bool, optional): commit the transaction. Defaults to True.
+
+            Raises:
+                IntegrityConflictException: if creation conflicts with existing data
+                ModelException: if `data` contains another kind of relationship
+
+            Returns:
+                list[dict[str, Any]]: created rows in the order of `data`, with
+                    the nested rows under their relationship keys
+            """
+            if not data:
+                return []
+            try:
+                created = [
+                    dict(row) for row in (await session.execute(
+                        insert_returning,
+                        [{key: value for key, value in item.items() if key in columns} for item in data],
+                    )).mappings()
+                ]
+                for key, rel in relationships.items():
+                    if key not in data[0]:
+                        continue
+                    if rel.direction is not ONETOMANY:
+                        raise ModelException(f"Relationship {key} can't be created in bulk.")
+                    children, parents = [], []
+                    for item, parent in zip(data, created):
+                        parent[key] = []
+                        for child in item[key] or ():
+                            children.append(child | {
+                                remote.key: parent[local.key] for local, remote in rel.local_remote_pairs
+                            })
+                            parents.append(parent)
+                    RelatedCrud = CrudFactory(rel.mapper.class_)
+                    for parent, child in zip(parents, await RelatedCrud.create_bulk(session, children, False)):
+                        parent[key].append(child)
+                if commit:
+                    await session.commit()
+            except IntegrityError:
+                raise IntegrityConflictException(
+                    f"{model.__tablename__} conflict with existing data.",
+                )
+            totals.invalidate(model)
+            return created
+
         @classmethod
         async def create_many(
             cls,
@@ -141,6 +310,7 @@ def CrudFactory(model: type[T]):
             try:
                 session.add_all(db_models)
                 await session.commit()
+                totals.invalidate(model)
             except IntegrityError:
                 raise IntegrityConflictException(
                     f"{model.__tablename__} conflict with existing data.",
@@ -163,6 +333,7 @@ def CrudFactory(model: type[T]):
             id_: str | UUID,
             column: str = "id",
             with_for_update: bool = False,
+            load: str | None = None,
         ) -> T | None:
             """Fetches one record from the database based on a column value and returns
             it, or returns None if it does not exist. Raises an exception if the column
@@ -176,20 +347,18 @@ def CrudFactory(model: type[T]):
                 with_for_update (bool, optional): Should the returned row be locked
                     during the lifetime of the current open transactions.
                     Defaults to False.
+                load (str, optional): name of a LOADER_PROFILES entry with the
+                    relationships to load. Defaults to None (columns only).
 
             Raises:
                 ModelException: if the column does not exist on the model
+                ModelException: if the loader profile does not exist
 
             Returns:
                 T: SQLAlchemy model or None
             """
-            try:
-                q = select(model).where(getattr(model, column) == id_)
-            except AttributeError:
-                raise ModelException(
-                    f"Column {column} not found on {model.__tablename__}.",
-                )
-
+            q = select_model.where(column_of(column) == id_)
+            q = q.options(*loader_options(load))
             if with_for_update:
                 q = q.with_for_update()
 
@@ -205,6 +374,10 @@ def CrudFactory(model: type[T]):
             limit: int = None,
             column: str = "id",
             with_for_update: bool = False,
+            load: str | None = None,
+            order_by: str | None = None,
+            cursor: str | None = None,
+            as_rows: bool = False,
         ) -> tuple[list[T], int]:
             """Fetches multiple records from the database based on a column value and
             returns them with the number of rows. Raises an exception if the column doesn't exist.
@@ -222,34 +395,66 @@ def CrudFactory(model: type[T]):
                 with_for_update (bool, optional): Should the returned rows be locked
                     during the lifetime of the current open transactions.
                     Defaults to False.
+                load (str, optional): name of a LOADER_PROFILES entry with the
+                    relationships to load. Defaults to None (columns only).
+                order_by (str, optional): a unique, indexed column to sort by.
+                    Required for keyset pagination. Defaults to None.
+                cursor (str, optional): keyset pagination token from `cursor_of`,
+                    only rows after it in `order_by` order are returned. Unlike
+                    OFFSET, every page costs the same. Defaults to None.
+                as_rows (bool, optional): return plain rows of the model's columns
+                    instead of SQLAlchemy models, skipping the identity map. `load`
+                    is ignored. Defaults to False.
 
             Raises:
                 ModelException: if the column does not exist on the model
+                ModelException: if the loader profile does not exist
+                ModelException: if the cursor is invalid or `order_by` is missing
 
             Returns:
                 list[T]: list of SQLAlchemy models
                 int: amount of rows
             """
-            q = (
-                select(model)
-                .offset(offset)
-                .limit(limit)
-            )
+            if as_rows:
+                q = select_rows
+            else:
+                q = select_model.options(*loader_options(load))
+            q = q.offset(offset).limit(limit)
+            if order_by:
+                order_column = column_of(order_by)
+                q = q.order_by(order_column)
+                if cursor:
+                    try:
+                        after = order_column.type.python_type(decode_cursor(cursor))
+                    except (TypeError, ValueError):
+                        raise ModelException(f"Invalid cursor {cursor}.")
+                    q = q.where(order_column > after)
+            elif cursor:
+                raise ModelException("A cursor requires order_by.")
             if ids:
-                try:
-                    q = q.where(getattr(model, column).in_(ids))
-                except AttributeError:
-                    raise ModelException(
-                        f"Column {column} not found on {model.__tablename__}.",
-                    )
+                q = q.where(column_of(column).in_(ids))
 
             if with_for_update:
                 q = q.with_for_update()
 
             rows = await session.execute(q)
-            data = rows.unique().scalars().all()
+            data = rows.all() if as_rows else rows.unique().scalars().all()
             return (data, len(data))
 
+        @classmethod
+        def cursor_of(cls, db_model: T, order_by: str = "id") -> str:
+            """Returns the keyset pagination token that continues after `db_model`.
+
+            Args:
+                db_model (T): last SQLAlchemy model of the current page
+                order_by (str, optional): the column the page is ordered by.
+                    Defaults to "id".
+
+            Returns:
+                str: cursor for `read_many`
+            """
+            return encode_cursor(getattr(db_model, order_by))
+
         @classmethod
         async def update(
             cls,
@@ -376,15 +581,11 @@ def CrudFactory(model: type[T]):
                 int: number of rows removed, 1 if successful, 0 if not. Can be greater
                     than 1 if id_ is not unique in the column.
             """
-            try:
-                query = delete(model).where(getattr(model, column) == id_)
-            except AttributeError:
-                raise ModelException(
-                    f"Column {column} not found on {model.__tablename__}.",
-                )
+            query = delete_model.where(column_of(column) == id_)
 
             rows = await session.execute(query)
             await session.commit()
+            totals.invalidate(model)
             return rows.rowcount
 
         @classmethod
@@ -413,15 +614,11 @@ def CrudFactory(model: type[T]):
             if not ids:
                 raise ModelException("No ids provided.")
 
-            try:
-                query = delete(model).where(getattr(model, column).in_(ids))
-            except AttributeError:
-                raise ModelException(
-                    f"Column {column} not found on {model.__tablename__}.",
-                )
+            query = delete_model.where(column_of(column).in_(ids))
 
             rows = await session.execute(query)
             await session.commit()
+            totals.invalidate(model)
             return rows.rowcount
 
     return AsyncCrud[T]
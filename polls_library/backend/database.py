@@ -1,29 +1,55 @@
 #https://github.com/ThomasAitken/demo-fastapi-async-sqlalchemy/blob/main/backend/app/database.py
 
 import contextlib
+import itertools
 from typing import Any, AsyncIterator
 
 from .config import settings
+from .metrics import MeteredQueuePool, instrument_pool
+from .query_stats import instrument_engine
+from .sqlite_profile import SingleWriter, apply_profile
 from sqlalchemy.ext.asyncio import (
     AsyncConnection,
+    AsyncEngine,
     AsyncSession,
     async_sessionmaker,
     create_async_engine,
 )
 
 
+def make_engine(host: str, engine_kwargs: dict[str, Any]) -> AsyncEngine:
+    engine = create_async_engine(host, **engine_kwargs)
+    instrument_engine(engine)
+    if settings.METRICS_ENABLED:
+        instrument_pool(engine)
+    if engine.dialect.name == "sqlite":
+        apply_profile(engine)
+        if settings.SQLITE_SINGLE_WRITER:
+            SingleWriter().install(engine)
+    return engine
+
+
 class DatabaseSessionManager:
-    def __init__(self, host: str, engine_kwargs: dict[str, Any] = {}):
-        self._engine = create_async_engine(host, **engine_kwargs)
+    def __init__(self, host: str, engine_kwargs: dict[str, Any] = {}, replica_hosts: list[str] = []):
+        self._engine = make_engine(host, engine_kwargs)
         self._sessionmaker = async_sessionmaker(bind=self._engine, expire_on_commit=False)
+        # read-only copies of the primary, used in turn by read_session()
+        self._replica_engines = [make_engine(replica, engine_kwargs) for replica in replica_hosts]
+        self._replica_sessionmakers = itertools.cycle([
+            async_sessionmaker(bind=engine, expire_on_commit=False) for engine in self._replica_engines
+        ] or [self._sessionmaker])
 
     async def close(self):
         if self._engine is None:
             raise Exception("DatabaseSessionManager is not initialized")
         await self._engine.dispose()
+        for engine in self._replica_engines:
+            await engine.dispose()
 
         self._engine = None
         self._sessionmaker = None
+        self._replica_engines = []
+        self._replica_sessionmakers = None
 
     @contextlib.asynccontextmanager
     async def connect(self) -> AsyncIterator[AsyncConnection]:
@@ -37,6 +63,30 @@ class DatabaseSessionManager:
                 await connection.rollback()
                 raise
 
+    @contextlib.asynccontextmanager
+    async def raw_connection(self) -> AsyncIterator[Any]:
+        """Pooled driver connection (e.g. asyncpg) for what SQLAlchemy doesn't
+        cover, like LISTEN. No transaction is started on it."""
+        if self._engine is None:
+            raise Exception("DatabaseSessionManager is not initialized")
+
+        async with self._engine.connect() as connection:
+            raw_connection = await connection.get_raw_connection()
+            yield raw_connection.driver_connection
+
+    @property
+    def dialect_name(self) -> str:
+        if self._engine is None:
+            raise Exception("DatabaseSessionManager is not initialized")
+        return self._engine.dialect.name
+
+    @property
+    def database(self) -> str | None:
+        """Database name, for SQLite the file path."""
+        if self._engine is None:
+            raise Exception("DatabaseSessionManager is not initialized")
+        return self._engine.url.database
+
     @contextlib.asynccontextmanager
     async def session(self) -> AsyncIterator[AsyncSession]:
         if self._sessionmaker is None:
@@ -51,10 +101,61 @@ class DatabaseSessionManager:
         finally:
             await session.close()
 
+    @contextlib.asynccontextmanager
+    async def read_session(self) -> AsyncIterator[AsyncSession]:
+        """Session on the next replica, or on the primary without replicas.
+
+        Replicas lag behind the primary, so don't use it to read what was
+        just written.
+        """
+        if self._replica_sessionmakers is None:
+            raise Exception("DatabaseSessionManager is not initialized")
+
+        session = next(self._replica_sessionmakers)()
+        try:
+            yield session
+        except Exception:
+            await session.rollback()
+            raise
+        finally:
+            await session.close()
+
+
+def pool_options() -> dict[str, Any]:
+    """create_async_engine arguments of the DB_* settings.
+
+    With DB_CONNECTION_BUDGET every one of the WEB_CONCURRENCY workers gets
+    an equal share of it as a fixed size pool, so all of them together
+    never open more connections than the budget. On Postgres one
+    connection of each worker's share is held by the LISTEN of
+    backend/live.py, hence at least 2.
+    """
+    pool_size, max_overflow = settings.DB_POOL_SIZE, settings.DB_MAX_OVERFLOW
+    if settings.DB_CONNECTION_BUDGET:
+        pool_size = max(2, settings.DB_CONNECTION_BUDGET // settings.WEB_CONCURRENCY)
+        max_overflow = 0
+    options: dict[str, Any] = {
+        "pool_size": pool_size,
+        "max_overflow": max_overflow,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+    }
+    if settings.METRICS_ENABLED:
+        options["poolclass"] = MeteredQueuePool
+    if not settings.DEBUG_USE_SQLITE:
+        # 0 for pgbouncer in transaction mode, which can't keep prepared statements
+        options["connect_args"] = {
+            "statement_cache_size": settings.DB_STATEMENT_CACHE_SIZE,
+            "prepared_statement_cache_size": settings.DB_STATEMENT_CACHE_SIZE,
+        }
+    return options
+
 
 sessionmanager = DatabaseSessionManager(settings.SQLALCHEMY_DATABASE_URI, {
     "echo": settings.DEBUG_ECHO_SQL,
-    })
+    **pool_options(),
+    }, settings.DB_REPLICA_URLS)
 
 async def get_db_session():
     async with sessionmanager.session() as session:
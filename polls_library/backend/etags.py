@@ -0,0 +1,106 @@
+from hashlib import blake2b
+from typing import Any, Hashable
+
+from fastapi import Request, Response
+from pydantic import BaseModel as PydanticModel
+
+from .cache import TTLCache
+from .config import settings
+
+# last ETag sent per resource key, e.g. ("poll", 1), ("results", 1), ("polls", 0, None);
+# other workers drop their copy after ETAG_CACHE_TTL
+etags = TTLCache(settings.ETAG_CACHE_TTL, settings.ETAG_CACHE_SIZE)
+
+# (body, ETag, Cache-Control scope) of closed polls, their final results and
+# vote pages, which never change
+closed = TTLCache(settings.CLOSED_POLL_MAX_AGE, settings.ETAG_CACHE_SIZE)
+
+
+def make_etag(body: bytes) -> str:
+    return f'W/"{blake2b(body, digest_size=8).hexdigest()}"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # weak comparison, W/"x" and "x" are the same entity
+    tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return etag.removeprefix("W/") in tags
+
+
+def not_modified(request: Request, key: Hashable) -> Response | None:
+    """Returns a 304 when the client already has the cached version of `key`,
+    without touching the database."""
+    etag = etags.get(key)
+    if etag and etag_matches(request, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    return None
+
+
+def conditional_response(
+    request: Request,
+    key: Hashable,
+    schema: type[PydanticModel],
+    data: Any,
+) -> Response:
+    """Serializes `data` with `schema`, remembers its ETag under `key` and
+    returns a 304 instead of the body if the client already has it."""
+    return conditional_body(request, key, schema.model_validate(data).model_dump_json().encode())
+
+
+def conditional_body(request: Request, key: Hashable, body: bytes) -> Response:
+    """`conditional_response` of an already serialized JSON body."""
+    etag = make_etag(body)
+    etags.set(key, etag)
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    return Response(body, media_type="application/json", headers={"ETag": etag})
+
+
+def closed_response(request: Request, key: Hashable) -> Response | None:
+    """Returns the cached response of a closed poll resource, if any."""
+    cached = closed.get(key)
+    if cached is None:
+        return None
+    body, etag, scope = cached
+    headers = {"ETag": etag, "Cache-Control": f"{scope}, max-age={settings.CLOSED_POLL_MAX_AGE}, immutable"}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
+
+
+def cache_closed(
+    request: Request,
+    key: Hashable,
+    schema: type[PydanticModel],
+    data: Any,
+) -> Response:
+    """Serializes a resource of a closed poll once and serves it from memory
+    afterwards, clients may cache it too."""
+    return cache_closed_body(request, key, schema.model_validate(data).model_dump_json().encode())
+
+
+def cache_closed_body(request: Request, key: Hashable, body: bytes, private: bool = False) -> Response:
+    """`cache_closed` of an already serialized JSON body, `private` ones
+    (behind a login) are only cached by the client."""
+    closed.set(key, (body, make_etag(body), "private" if private else "public"))
+    return closed_response(request, key)
+
+
+def invalidate_poll(poll_id: int, listings: bool = False) -> None:
+    """Drops the ETags of a poll's results, and with `listings` also of the
+    poll itself, of every polls listing page and the cache of a closed poll."""
+    etags.pop(("results", poll_id))
+    if listings:
+        etags.pop(("poll", poll_id))
+        closed.pop(("poll", poll_id))
+        closed.pop(("results", poll_id))
+        for key in closed.keys():
+            if key[0] == "votes" and key[1] == poll_id:
+                closed.pop(key)
+        for key in etags.keys():
+            if key[0] == "polls":
+                etags.pop(key)
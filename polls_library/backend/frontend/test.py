@@ -1,18 +1,37 @@
 from fastapi.responses import RedirectResponse
 from fastapi.templating import Jinja2Templates
 from fastapi import APIRouter, Request
-from sqlalchemy import select, func
-from sqlalchemy.orm import selectinload
-from datetime import datetime
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader
+from markupsafe import Markup
+from sqlalchemy import select
+from datetime import datetime, timezone
 
+from ..cache import TTLCache
 from ..config import settings
-from ..api.deps import CurrentUser, SessionDep
-from ..models.models import PollModel, VoteModel
+from ..counts import totals
+from ..api.deps import CurrentUser, ReadSessionDep
+from ..models.models import OptionModel, PollModel, VoteModel, VoteOptionLinksModel
+from ..poll_closer import has_expired
 
 def base_context(request: Request):
     return {"PROJECT_NAME": settings.PROJECT_NAME}
 
-templates = Jinja2Templates(directory="backend/frontend/templates", context_processors=[base_context])
+templates = Jinja2Templates(
+    env=Environment(
+        loader=FileSystemLoader("backend/frontend/templates"),
+        autoescape=True,
+        # compiled templates are shared by the workers and survive restarts
+        bytecode_cache=FileSystemBytecodeCache(settings.JINJA_BYTECODE_CACHE_DIR)
+            if settings.JINJA_BYTECODE_CACHE else None,
+        auto_reload=settings.DEBUG,
+    ),
+    context_processors=[base_context],
+)
+
+# rendered poll_form/poll_expired fragments by (kind, poll id, created_at); polls
+# can't be edited, created_at tells a poll from a later one that reused its id
+fragments = TTLCache(settings.FRAGMENT_CACHE_TTL, settings.FRAGMENT_CACHE_SIZE)
+
 frontend_router = APIRouter(prefix="/frontend", tags=["frontend"])
 
 @frontend_router.get("/new-poll", name="frontend_create_poll")
@@ -34,10 +53,12 @@ async def read_polls_redirect(request: Request, current_user: CurrentUser, page:
 async def read_polls(
     request: Request,
     current_user: CurrentUser,
-    db: SessionDep,
-    page: int = 1
+    db: ReadSessionDep,
+    page: int = 1,
+    after: int | None = None,
+    before: int | None = None,
 ):
-    total_polls = await db.scalar(select(func.count(PollModel.id)))
+    total_polls = await totals.count(db, PollModel)
     
     if total_polls == 0:
         max_page = 1
@@ -49,31 +70,85 @@ async def read_polls(
     elif page > max_page:
         page = max_page
     
-    offset = (page - 1) * settings.BACKEND_PAGINATION_AMOUNT
-    
     polls_query = (
-        select(PollModel)
-        .options(selectinload(PollModel.options))
-        .offset(offset)
+        select(
+            PollModel.id,
+            PollModel.title,
+            PollModel.multiple_choice,
+            PollModel.created_at,
+            PollModel.expires_at,
+        )
         .limit(settings.BACKEND_PAGINATION_AMOUNT)
     )
+    # Previous/Next links carry the first/last poll id of the page (keyset),
+    # OFFSET is only used when a page number is opened directly
+    if after is not None:
+        polls_query = polls_query.where(PollModel.id > after).order_by(PollModel.id)
+    elif before is not None:
+        polls_query = polls_query.where(PollModel.id < before).order_by(PollModel.id.desc())
+    else:
+        offset = (page - 1) * settings.BACKEND_PAGINATION_AMOUNT
+        polls_query = polls_query.order_by(PollModel.id).offset(offset)
     
-    polls_result = await db.execute(polls_query)
-    polls = polls_result.scalars().all()
+    polls = (await db.execute(polls_query)).all()
+    if before is not None:
+        polls = polls[::-1]
+    poll_ids = [poll.id for poll in polls]
     
+    # the user's choices, the only part of the page rendered for every request
     user_votes = {}
-    if current_user:
+    if current_user and poll_ids:
         votes_query = (
-            select(VoteModel)
-            .filter(VoteModel.voter_id == current_user.id)
-            .options(selectinload(VoteModel.selected_options))
+            select(VoteModel.poll_id, OptionModel.title)
+            .join(VoteOptionLinksModel, VoteOptionLinksModel.vote_id == VoteModel.id)
+            .join(OptionModel, OptionModel.id == VoteOptionLinksModel.option_id)
+            .where(VoteModel.voter_id == current_user.id, VoteModel.poll_id.in_(poll_ids))
         )
-        votes_result = await db.execute(votes_query)
-        user_votes_list = votes_result.scalars().all()
-        
-        for vote in user_votes_list:
-            options_dict = {option.id: option.title for option in vote.selected_options}
-            user_votes[vote.poll_id] = options_dict
+        for poll_id, option_title in await db.execute(votes_query):
+            user_votes.setdefault(poll_id, []).append(option_title)
+    
+    now = datetime.now(timezone.utc)
+    macros = templates.get_template("poll_fragments.jinja2").module
+    kinds = {}
+    for poll in polls:
+        if has_expired(poll.expires_at, now):
+            kinds[poll.id] = "expired"
+        elif poll.id not in user_votes:
+            kinds[poll.id] = "form"
+    
+    # looked up once, an entry evicted during the options query below would
+    # otherwise be rendered (and cached) without its options
+    cached = {}
+    for poll in polls:
+        if poll.id in kinds:
+            key = (kinds[poll.id], poll.id, poll.created_at)
+            cached[key] = fragments.get(key)
+    # options are only needed for the forms that aren't cached yet
+    missing = [key[1] for key, fragment in cached.items() if key[0] == "form" and fragment is None]
+    options = {}
+    if missing:
+        options_query = (
+            select(OptionModel.poll_id, OptionModel.id, OptionModel.title)
+            .where(OptionModel.poll_id.in_(missing))
+        )
+        for option in await db.execute(options_query):
+            options.setdefault(option.poll_id, []).append(option)
+    
+    rendered: list[Markup] = []
+    for poll in polls:
+        kind = kinds.get(poll.id)
+        if kind is None:
+            rendered.append(macros.poll_voted(poll, user_votes[poll.id]))
+            continue
+        key = (kind, poll.id, poll.created_at)
+        fragment = cached[key]
+        if fragment is None:
+            if kind == "form":
+                fragment = macros.poll_form(poll, options.get(poll.id, []))
+            else:
+                fragment = macros.poll_expired(poll)
+            fragments.set(key, fragment)
+        rendered.append(fragment)
     
     return templates.TemplateResponse(
         request=request,
@@ -81,12 +156,12 @@ async def read_polls(
         context={
             "current_user": current_user,
             "page": page,
-            "polls": polls,
+            "fragments": rendered,
+            "first_id": poll_ids[0] if poll_ids else None,
+            "last_id": poll_ids[-1] if poll_ids else None,
             "polls_count": total_polls,
-            "user_votes": user_votes,
             "user_votes_count": len(user_votes),
             "max_page": max_page,
-            "datetime": datetime
         },
     )
 
@@ -1,7 +1,5 @@
-from sqlalchemy.engine import Engine
 from .database import get_db_connection
 from .config import settings
-from sqlalchemy import event
 
 
 async def init_db() -> None:
@@ -11,11 +9,7 @@ async def init_db() -> None:
     the tables un-commenting the next lines.
     '''
     if settings.DEBUG_USE_SQLITE:
-        @event.listens_for(Engine, "connect")
-        def set_sqlite_pragma(dbapi_connection, connection_record):
-            cursor = dbapi_connection.cursor()
-            cursor.execute("PRAGMA foreign_keys=ON")
-            cursor.close()
+        # pragmas (foreign_keys, WAL...) are set by backend/sqlite_profile.py
         from .models import models
         async with get_db_connection() as connection:
             await connection.run_sync(models.BaseModel.metadata.create_all)
\ No newline at end of file
@@ -0,0 +1,140 @@
+import asyncio
+import json
+import logging
+from uuid import UUID
+
+from sqlalchemy import event, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from .database import sessionmanager
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "poll_tallies"
+
+
+class Subscription:
+    """Latest option counts not yet sent to one client.
+
+    Counts are absolute, so updates arriving while the client is slow are
+    merged into one message instead of queueing up.
+    """
+
+    def __init__(self):
+        self._counts: dict[str, int] = {}
+        self._changed = asyncio.Event()
+
+    def push(self, counts: dict[str, int]) -> None:
+        self._counts.update(counts)
+        self._changed.set()
+
+    async def next(self, timeout: float) -> dict[str, int] | None:
+        """Waits for new counts, returns None after `timeout` seconds without any."""
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout)
+        except TimeoutError:
+            return None
+        self._changed.clear()
+        counts, self._counts = self._counts, {}
+        return counts
+
+
+class LiveHub:
+    """Per-worker fan-out of tally changes to live result subscribers.
+
+    On Postgres every worker LISTENs on one connection and votes NOTIFY in
+    their transaction, so a single notification reaches the subscribers of
+    all workers. Elsewhere (SQLite, one process) changes are dispatched
+    in-process after the commit.
+    """
+
+    def __init__(self):
+        self._subscribers: dict[int, set[Subscription]] = {}
+        self._listener: asyncio.Task | None = None
+        self.listening = False
+
+    def subscribe(self, poll_id: int) -> Subscription:
+        subscription = Subscription()
+        self._subscribers.setdefault(poll_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, poll_id: int, subscription: Subscription) -> None:
+        subscribers = self._subscribers.get(poll_id)
+        if subscribers:
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self._subscribers[poll_id]
+
+    def dispatch(self, payload: str) -> None:
+        message = json.loads(payload)
+        for subscription in self._subscribers.get(message["poll_id"], ()):
+            subscription.push(message["options"])
+
+    async def start(self) -> None:
+        if sessionmanager.dialect_name == "postgresql":
+            self._listener = asyncio.create_task(self._listen())
+
+    async def stop(self) -> None:
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+
+    async def _listen(self) -> None:
+        def on_notification(connection, pid, channel, payload):
+            self.dispatch(payload)
+
+        while True:
+            try:
+                async with sessionmanager.raw_connection() as connection:
+                    await connection.add_listener(CHANNEL, on_notification)
+                    self.listening = True
+                    try:
+                        await asyncio.Future()
+                    finally:
+                        self.listening = False
+                        await connection.remove_listener(CHANNEL, on_notification)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Lost the %s listener, reconnecting", CHANNEL)
+                await asyncio.sleep(1)
+
+
+live_hub = LiveHub()
+
+
+async def publish_tallies(session: AsyncSession, poll_id: int, counts: dict[UUID, int]) -> None:
+    """Sends the new option counts of a poll to live subscribers once the
+    session's transaction commits.
+
+    Args:
+        session (AsyncSession): session holding the vote's transaction
+        poll_id (int): poll the options belong to
+        counts (dict[UUID, int]): new votes_count per option, as returned
+            by change_tallies
+    """
+    items = [(str(option_id), count) for option_id, count in counts.items()]
+    # NOTIFY payloads are limited to 8000 bytes
+    for start in range(0, len(items), 100):
+        payload = json.dumps({"poll_id": poll_id, "options": dict(items[start:start + 100])})
+        if live_hub.listening:
+            # delivered by Postgres on commit, to every worker including this one
+            await session.execute(select(func.pg_notify(CHANNEL, payload)))
+        else:
+            session.info.setdefault("live_payloads", []).append(payload)
+
+
+@event.listens_for(Session, "after_commit")
+def dispatch_after_commit(session: Session):
+    for payload in session.info.pop("live_payloads", ()):
+        live_hub.dispatch(payload)
+
+
+@event.listens_for(Session, "after_rollback")
+def discard_after_rollback(session: Session):
+    session.info.pop("live_payloads", None)
@@ -7,8 +7,14 @@ from starlette.middleware.sessions import SessionMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
 from fastapi.middleware.cors import CORSMiddleware
 from .api.main import api_router
+from .compression import CompressionMiddleware
 from .exceptions import UserMissingException
 from .frontend.test import frontend_router
+from .live import live_hub
+from .metrics import MetricsMiddleware, metrics_response
+from .poll_closer import poll_closer
+from .query_stats import QueryStatsMiddleware
+from .vote_buffer import vote_buffer
 
 def init_middleware(app: FastAPI):
     app.add_middleware(SessionMiddleware, secret_key=settings.SECRET_KEY, max_age=settings.MAX_SESSION_AGE)
@@ -25,11 +31,34 @@ def init_middleware(app: FastAPI):
         from starlette.middleware.httpsredirect import HTTPSRedirectMiddleware
         app.add_middleware(HTTPSRedirectMiddleware)
 
+    if settings.DEBUG and settings.DEBUG_QUERY_STATS:
+        app.add_middleware(QueryStatsMiddleware, repeat_threshold=settings.DEBUG_REPEATED_QUERY_THRESHOLD)
+
+    if settings.COMPRESSION_ENABLED:
+        app.add_middleware(
+            CompressionMiddleware,
+            minimum_size=settings.COMPRESSION_MINIMUM_SIZE,
+            content_types=tuple(settings.COMPRESSION_CONTENT_TYPES),
+            encodings=tuple(settings.COMPRESSION_ENCODINGS),
+        )
+
+    if settings.METRICS_ENABLED:
+        # outermost, so the time spent in the other middleware is counted too
+        # and the response sizes are the compressed ones
+        app.add_middleware(MetricsMiddleware)
+
 
 @contextlib.asynccontextmanager
 async def lifespan(app: FastAPI):
     await init_db()
+    await live_hub.start()
+    if settings.VOTE_BATCHING:
+        await vote_buffer.start()
+    await poll_closer.start()
     yield
+    await poll_closer.stop()
+    await vote_buffer.stop()
+    await live_hub.stop()
 
 app = FastAPI(
     title=settings.PROJECT_NAME,
@@ -46,6 +75,11 @@ async def requires_login(request: Request, _: Exception):
 app.include_router(api_router, prefix=settings.API_V1_STR)
 app.include_router(frontend_router)
 
+if settings.METRICS_ENABLED:
+    @app.get("/metrics", include_in_schema=False)
+    def metrics():
+        return metrics_response()
+
 if settings.DEBUG_REDIRECT_APIV1:
     from fastapi.responses import RedirectResponse # noqa: E402
     @app.get("/")
@@ -0,0 +1,164 @@
+"""Prometheus metrics of the HTTP requests and of the database time they use.
+
+Under gunicorn every worker is its own process, so with
+PROMETHEUS_MULTIPROC_DIR set (see docker-entrypoint.sh) the metrics are
+written to files in that directory and /metrics sums up all the workers.
+"""
+import os
+import time
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+)
+from prometheus_client.multiprocess import MultiProcessCollector
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from starlette.responses import Response
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .query_stats import RequestStats, request_stats
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+WAIT_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30)
+
+REQUESTS = Counter(
+    "http_requests_total", "HTTP requests by route and status code", ["method", "route", "status"]
+)
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds", "Time until the response was sent", ["method", "route"],
+    buckets=LATENCY_BUCKETS,
+)
+RESPONSE_SIZE = Histogram(
+    "http_response_size_bytes", "Response body size", ["method", "route"], buckets=SIZE_BUCKETS
+)
+REQUESTS_IN_PROGRESS = Gauge(
+    "http_requests_in_progress", "Requests being handled", ["method"], multiprocess_mode="livesum"
+)
+REQUEST_DB_TIME = Histogram(
+    "http_request_db_seconds", "Time spent executing SQL per request", ["method", "route"],
+    buckets=LATENCY_BUCKETS,
+)
+REQUEST_DB_QUERIES = Histogram(
+    "http_request_db_queries", "SQL statements executed per request", ["method", "route"],
+    buckets=QUERY_BUCKETS,
+)
+
+DB_POOL_CONNECTIONS = Gauge(
+    "db_pool_connections", "Connections the pools may open (size + overflow)", multiprocess_mode="livesum"
+)
+DB_POOL_OPEN = Gauge("db_pool_open", "Open pooled connections", multiprocess_mode="livesum")
+DB_POOL_IN_USE = Gauge("db_pool_in_use", "Checked out pooled connections", multiprocess_mode="livesum")
+DB_POOL_CHECKOUT_WAIT = Histogram(
+    "db_pool_checkout_seconds", "Time to get a connection from the pool", buckets=WAIT_BUCKETS
+)
+DB_POOL_TIMEOUTS = Counter("db_pool_timeouts_total", "Checkouts that gave up after DB_POOL_TIMEOUT")
+
+
+class MeteredQueuePool(AsyncAdaptedQueuePool):
+    """AsyncAdaptedQueuePool timing every checkout, including the wait for
+    a free connection when the pool is exhausted."""
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            return super().connect()
+        except PoolTimeoutError:
+            DB_POOL_TIMEOUTS.inc()
+            raise
+        finally:
+            DB_POOL_CHECKOUT_WAIT.observe(time.perf_counter() - start)
+
+
+def instrument_pool(engine: AsyncEngine) -> None:
+    """Tracks the open and checked out connections of `engine`'s pool."""
+    pool = engine.sync_engine.pool
+    if isinstance(pool, AsyncAdaptedQueuePool):
+        DB_POOL_CONNECTIONS.inc(pool.size() + max(pool._max_overflow, 0))
+
+    @event.listens_for(pool, "connect")
+    def connect(dbapi_connection, connection_record):
+        DB_POOL_OPEN.inc()
+
+    @event.listens_for(pool, "close")
+    @event.listens_for(pool, "close_detached")
+    def close(dbapi_connection, *args):
+        DB_POOL_OPEN.dec()
+
+    @event.listens_for(pool, "checkout")
+    def checkout(dbapi_connection, connection_record, connection_proxy):
+        DB_POOL_IN_USE.inc()
+
+    @event.listens_for(pool, "checkin")
+    def checkin(dbapi_connection, connection_record):
+        DB_POOL_IN_USE.dec()
+
+
+class MetricsMiddleware:
+    """Records the metrics above for every HTTP request.
+
+    Routes are labelled with their path template (/api/v1/polls/{id}), so
+    the number of series doesn't grow with the number of polls.
+    """
+
+    def __init__(self, app: ASGIApp, skip_paths: tuple[str, ...] = ("/metrics",)):
+        self.app = app
+        self.skip_paths = skip_paths
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["path"] in self.skip_paths:
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status = 500
+        size = 0
+        stats, token = request_stats.get(), None
+        if stats is None:
+            stats = RequestStats()
+            token = request_stats.set(stats)
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status, size
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        in_progress = REQUESTS_IN_PROGRESS.labels(method)
+        in_progress.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            in_progress.dec()
+            if token is not None:
+                request_stats.reset(token)
+            # set by the router on the (shared) scope once a route matched
+            route = scope.get("route")
+            route = getattr(route, "path", None) or "<unmatched>"
+            REQUESTS.labels(method, route, str(status)).inc()
+            REQUEST_LATENCY.labels(method, route).observe(elapsed)
+            RESPONSE_SIZE.labels(method, route).observe(size)
+            REQUEST_DB_TIME.labels(method, route).observe(stats.db_seconds)
+            REQUEST_DB_QUERIES.labels(method, route).observe(stats.queries)
+
+
+def metrics_response() -> Response:
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
@@ -2,7 +2,7 @@ from datetime import datetime, timedelta, timezone
 from uuid import uuid4
 
 from pydantic import EmailStr
-from sqlalchemy import ForeignKey, String
+from sqlalchemy import JSON, ForeignKey, Index, String, UniqueConstraint, text
 from uuid import UUID
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 from sqlalchemy.ext.asyncio import AsyncAttrs
@@ -19,29 +19,52 @@ class UserModel(BaseModel):
 
 
     # Relationships
-    polls: Mapped[list["PollModel"]] = relationship(back_populates="author", lazy="selectin", cascade="all, delete, delete-orphan")
-    votes: Mapped[list["VoteModel"]] = relationship(back_populates="voter", lazy="selectin", cascade="all, delete, delete-orphan")
+    polls: Mapped[list["PollModel"]] = relationship(back_populates="author", lazy="raise", cascade="all, delete, delete-orphan")
+    votes: Mapped[list["VoteModel"]] = relationship(back_populates="voter", lazy="raise", cascade="all, delete, delete-orphan")
 
 
 class PollModel(BaseModel):
     __tablename__ = 'polls'  # Specify the table name
-
-    id: Mapped[int] = mapped_column(primary_key=True, nullable=True)
+    # indexes are created by the c4e8b3f17a92 migration, mirrored here for create_all
+    __table_args__ = (
+        Index("ix_polls_author_id", "author_id"),
+        # polls that can still close (3d9f6b2c8e15), partial so polls without
+        # a deadline and closed ones don't grow it
+        Index(
+            "ix_polls_expires_at_open", "expires_at",
+            postgresql_where=text("closed_at IS NULL AND expires_at IS NOT NULL"),
+            sqlite_where=text("closed_at IS NULL AND expires_at IS NOT NULL"),
+        ),
+    )
+
+    id: Mapped[int] = mapped_column(primary_key=True)
     title: Mapped[str] = mapped_column(nullable=False)
     description: Mapped[str | None] = mapped_column(nullable=True)
     multiple_choice: Mapped[bool] = mapped_column(default=False)
     anonymous: Mapped[bool] = mapped_column(default=False)
     created_at: Mapped[datetime] = mapped_column(default=lambda: datetime.now(timezone.utc) + timedelta(hours=3))
     expires_at: Mapped[datetime | None] = mapped_column(nullable=True)
+    # set by backend.poll_closer once the final results are in poll_results
+    closed_at: Mapped[datetime | None] = mapped_column(nullable=True)
     
     # author & author_id are '| None' for allowing user.polls=None
     author_id: Mapped[EmailStr | None] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"), nullable=False)  # Foreign key to User
-    author: Mapped["UserModel | None"] = relationship(back_populates="polls", lazy="selectin")
-    options: Mapped[list["OptionModel"]] = relationship(back_populates="poll", cascade="all, delete, delete-orphan", lazy="selectin")
-    votes: Mapped[list["VoteModel"]] = relationship(back_populates="poll", cascade="all, delete, delete-orphan")
+    author: Mapped["UserModel | None"] = relationship(back_populates="polls", lazy="raise")
+    options: Mapped[list["OptionModel"]] = relationship(back_populates="poll", cascade="all, delete, delete-orphan", lazy="raise")
+    votes: Mapped[list["VoteModel"]] = relationship(back_populates="poll", cascade="all, delete, delete-orphan", lazy="raise")
+
+class PollResultsModel(BaseModel):
+    __tablename__ = 'poll_results'  # Specify the table name
+
+    # final results of a closed poll, written once and never updated
+    poll_id: Mapped[int] = mapped_column(ForeignKey("polls.id", ondelete="CASCADE"), primary_key=True)
+    closed_at: Mapped[datetime] = mapped_column(nullable=False)
+    options: Mapped[list[dict]] = mapped_column(JSON, nullable=False)  # [{"id", "title", "votes_count"}]
+
 
 class VoteOptionLinksModel(BaseModel):
     __tablename__ = 'vote_option_links'  # Specify the table name
+    __table_args__ = (Index("ix_vote_option_links_option_id", "option_id"),)
 
     vote_id: Mapped[UUID] = mapped_column(ForeignKey("votes.id", ondelete="CASCADE"), primary_key=True)
     option_id: Mapped[UUID] = mapped_column(ForeignKey("options.id", ondelete="CASCADE"), primary_key=True)
@@ -49,22 +72,41 @@ class VoteOptionLinksModel(BaseModel):
 
 class OptionModel(BaseModel):
     __tablename__ = 'options'  # Specify the table name
+    __table_args__ = (Index("ix_options_poll_id", "poll_id"),)
 
     id: Mapped[UUID] = mapped_column(default=uuid4, primary_key=True)
     title: Mapped[str] = mapped_column(nullable=False)
     poll_id: Mapped[int] = mapped_column(ForeignKey("polls.id", ondelete="CASCADE"), nullable=False)  # Foreign key to Poll
-    poll: Mapped["PollModel"] = relationship(back_populates="options", lazy="selectin")
-    votes: Mapped[list["VoteModel"]] = relationship(secondary="vote_option_links", back_populates="selected_options", lazy="selectin", cascade="all, delete")
+    # Denormalized tally, kept in sync by backend.tallies in the vote transaction
+    votes_count: Mapped[int] = mapped_column(default=0, server_default="0", nullable=False)
+    poll: Mapped["PollModel"] = relationship(back_populates="options", lazy="raise")
+    votes: Mapped[list["VoteModel"]] = relationship(secondary="vote_option_links", back_populates="selected_options", lazy="raise", cascade="all, delete")
 
 
 class VoteModel(BaseModel):
     __tablename__ = 'votes'  # Specify the table name
+    # one vote per user and poll, enforced by the database instead of a read-before-write
+    __table_args__ = (
+        UniqueConstraint("voter_id", "poll_id", name="uq_votes_voter_id_poll_id"),
+        # votes of a poll in id order (listing pages and exports)
+        Index("ix_votes_poll_id_id", "poll_id", "id"),
+    )
 
     id: Mapped[UUID] = mapped_column(default=uuid4, primary_key=True)
 
     # voter & voter_id are '| None' for allowing user.votes=None
     voter_id: Mapped[EmailStr | None] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
-    voter: Mapped["UserModel | None"] = relationship(back_populates="votes", lazy="selectin")
+    voter: Mapped["UserModel | None"] = relationship(back_populates="votes", lazy="raise")
     poll_id: Mapped[int] = mapped_column(ForeignKey("polls.id", ondelete="CASCADE"), nullable=False)
-    poll: Mapped["PollModel"] = relationship(back_populates="votes", lazy="selectin", passive_deletes=True)
-    selected_options: Mapped[list["OptionModel"]] = relationship(secondary="vote_option_links", back_populates="votes", lazy="selectin",passive_deletes=True)
\ No newline at end of file
+    poll: Mapped["PollModel"] = relationship(back_populates="votes", lazy="raise", passive_deletes=True)
+    selected_options: Mapped[list["OptionModel"]] = relationship(secondary="vote_option_links", back_populates="votes", lazy="raise",passive_deletes=True)
+
+class RateLimitBucketModel(BaseModel):
+    __tablename__ = 'rate_limit_buckets'  # Specify the table name
+
+    # shared state of backend.rate_limit with RATE_LIMIT_BACKEND="database"
+    key: Mapped[str] = mapped_column(String(length=255), primary_key=True)
+    # theoretical arrival time (unix time) of the next request, see backend.rate_limit
+    tat: Mapped[float] = mapped_column(nullable=False)
+    # whether the last request was let through, set by the same upsert
+    allowed: Mapped[bool] = mapped_column(nullable=False)
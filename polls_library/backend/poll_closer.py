@@ -0,0 +1,160 @@
+import asyncio
+import contextlib
+import fcntl
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator
+
+from sqlalchemy import func, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .config import settings
+from .database import sessionmanager
+from .etags import invalidate_poll
+from .models.models import OptionModel, PollModel, PollResultsModel, VoteOptionLinksModel
+
+logger = logging.getLogger(__name__)
+
+# Postgres advisory lock held by the worker running a pass, any constant shared by all workers
+LOCK_KEY = 4_180_725_311
+BATCH_SIZE = 500
+
+
+def has_expired(expires_at: datetime | None, now: datetime) -> bool:
+    """Compares a stored expires_at with an aware `now`. The column has no
+    time zone, so values read back naive are UTC."""
+    if expires_at is None:
+        return False
+    if expires_at.tzinfo is None:
+        expires_at = expires_at.replace(tzinfo=timezone.utc)
+    return expires_at < now
+
+
+async def close_expired_polls(session: AsyncSession, before: datetime, limit: int = BATCH_SIZE) -> list[int]:
+    """Freezes the results of polls that expired before `before`.
+
+    Counts the votes of each option from `vote_option_links` once, stores
+    them in `poll_results` and marks the polls closed. Does not commit.
+
+    Args:
+        session (AsyncSession): SQLAlchemy async session
+        before (datetime): naive UTC time, like the stored expires_at
+        limit (int, optional): polls closed at most. Defaults to BATCH_SIZE.
+
+    Returns:
+        list[int]: ids of the closed polls
+    """
+    poll_ids = (await session.scalars(
+        select(PollModel.id)
+        .where(PollModel.expires_at <= before, PollModel.closed_at.is_(None))
+        .order_by(PollModel.expires_at)
+        .limit(limit)
+    )).all()
+    if not poll_ids:
+        return []
+
+    rows = await session.execute(
+        select(OptionModel.poll_id, OptionModel.id, OptionModel.title, func.count(VoteOptionLinksModel.vote_id))
+        .outerjoin(VoteOptionLinksModel, VoteOptionLinksModel.option_id == OptionModel.id)
+        .where(OptionModel.poll_id.in_(poll_ids))
+        .group_by(OptionModel.poll_id, OptionModel.id, OptionModel.title)
+    )
+    results: dict[int, list[dict]] = {poll_id: [] for poll_id in poll_ids}
+    for poll_id, option_id, title, votes_count in rows:
+        results[poll_id].append({"id": str(option_id), "title": title, "votes_count": votes_count})
+
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    await session.execute(
+        insert(PollResultsModel),
+        [{"poll_id": poll_id, "closed_at": now, "options": options} for poll_id, options in results.items()],
+    )
+    await session.execute(
+        update(PollModel)
+        .where(PollModel.id.in_(poll_ids))
+        .values(closed_at=now)
+        .execution_options(synchronize_session=False)
+    )
+    return list(poll_ids)
+
+
+class PollCloser:
+    """Background task closing expired polls every `interval` seconds.
+
+    Every worker runs it, but a pass only goes ahead in the worker that gets
+    the lock: a transaction-level advisory lock on Postgres, a file lock
+    next to the database on SQLite. No connection is held between passes.
+    """
+
+    def __init__(self, interval: float, grace: float):
+        self._interval = interval
+        self._grace = timedelta(seconds=grace)
+        self._task: asyncio.Task | None = None
+
+    async def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.close_expired()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Closing expired polls failed")
+            await asyncio.sleep(self._interval)
+
+    async def close_expired(self) -> list[int]:
+        """Runs one pass unless another worker is, returns the closed poll ids."""
+        closed: list[int] = []
+        async with sessionmanager.session() as session:
+            async with self._leadership(session) as leader:
+                if not leader:
+                    return []
+                # expires_at is stored as naive UTC
+                before = datetime.now(timezone.utc).replace(tzinfo=None) - self._grace
+                while batch := await close_expired_polls(session, before):
+                    await session.commit()
+                    closed += batch
+                    if len(batch) < BATCH_SIZE:
+                        break
+                    if sessionmanager.dialect_name == "postgresql":
+                        # the commit released the transaction-level lock
+                        if not await session.scalar(select(func.pg_try_advisory_xact_lock(LOCK_KEY))):
+                            break
+        for poll_id in closed:
+            invalidate_poll(poll_id, listings=True)
+        if closed:
+            logger.info("Closed %d expired polls", len(closed))
+        return closed
+
+    @contextlib.asynccontextmanager
+    async def _leadership(self, session: AsyncSession) -> AsyncIterator[bool]:
+        if sessionmanager.dialect_name == "postgresql":
+            yield bool(await session.scalar(select(func.pg_try_advisory_xact_lock(LOCK_KEY))))
+            return
+        database = sessionmanager.database
+        if not database or database == ":memory:":
+            yield True
+            return
+        with open(f"{database}.closer.lock", "w") as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+poll_closer = PollCloser(settings.POLL_CLOSE_INTERVAL, settings.POLL_CLOSE_GRACE_SECONDS)
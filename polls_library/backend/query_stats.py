@@ -0,0 +1,123 @@
+"""Per-request accounting of the SQL statements executed.
+
+Every engine of DatabaseSessionManager is instrumented; statements are
+only counted while a request set `request_stats` (MetricsMiddleware or
+QueryStatsMiddleware), so background tasks like the vote buffer are not.
+"""
+import logging
+import re
+import time
+from collections import Counter
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+logger = logging.getLogger(__name__)
+
+# "IN (?, ?, ?)" and "VALUES ($1, $2), ($3, $4)" have the same shape whatever the number of parameters
+_PARAMETER_LISTS = re.compile(r"\((?:\s*(?:\?|\$\d+|%\(\w+\)s|:\w+)\s*,?)+\)(?:\s*,\s*\((?:\s*(?:\?|\$\d+|%\(\w+\)s|:\w+)\s*,?)+\))*")
+
+
+def statement_shape(statement: str) -> str:
+    return _PARAMETER_LISTS.sub("(?)", " ".join(statement.split()))
+
+
+@dataclass(slots=True)
+class RequestStats:
+    queries: int = 0
+    rows: int = 0
+    db_seconds: float = 0.0
+    # executions per statement shape, only collected with `track_shapes`
+    shapes: Counter[str] = field(default_factory=Counter)
+    track_shapes: bool = False
+
+    def repeated(self, threshold: int) -> list[tuple[str, int]]:
+        """Statement shapes executed more than `threshold` times, most frequent first."""
+        return [(shape, count) for shape, count in self.shapes.most_common() if count > threshold]
+
+
+# stats of the request being handled, filled in by the engine events below
+request_stats: ContextVar[RequestStats | None] = ContextVar("request_stats", default=None)
+
+
+def instrument_engine(engine: AsyncEngine) -> None:
+    """Adds every statement executed on `engine` to the current request's
+    RequestStats."""
+
+    @event.listens_for(engine.sync_engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if request_stats.get() is not None:
+            conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine.sync_engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        stats = request_stats.get()
+        if stats is None:
+            return
+        stats.db_seconds += time.perf_counter() - conn.info["query_start"].pop()
+        stats.queries += 1
+        # asyncpg reports SELECT row counts, aiosqlite doesn't but has already
+        # fetched the rows into the adapted cursor
+        rowcount = cursor.rowcount
+        stats.rows += rowcount if rowcount >= 0 else len(getattr(cursor, "_rows", None) or ())
+        if stats.track_shapes:
+            stats.shapes[statement_shape(statement)] += 1
+
+    @event.listens_for(engine.sync_engine, "handle_error")
+    def handle_error(exception_context):
+        if exception_context.connection is not None:
+            starts = exception_context.connection.info.get("query_start")
+            if starts:
+                starts.pop()
+
+
+class QueryStatsMiddleware:
+    """Reports the statements of every request, for development.
+
+    Adds X-DB-Queries, X-DB-Rows and X-DB-Time-Ms headers, logs them, and
+    warns about statement shapes repeated more than `repeat_threshold`
+    times in one request, the usual sign of an N+1 loop. Streaming
+    responses only count the statements run before their headers.
+    """
+
+    def __init__(self, app: ASGIApp, repeat_threshold: int = 10):
+        self.app = app
+        self.repeat_threshold = repeat_threshold
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats, token = request_stats.get(), None
+        if stats is None:
+            stats = RequestStats()
+            token = request_stats.set(stats)
+        stats.track_shapes = self.repeat_threshold > 0
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                headers["X-DB-Queries"] = str(stats.queries)
+                headers["X-DB-Rows"] = str(stats.rows)
+                headers["X-DB-Time-Ms"] = f"{stats.db_seconds * 1000:.2f}"
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            if token is not None:
+                request_stats.reset(token)
+            path = f'{scope["method"]} {scope["path"]}'
+            logger.debug(
+                "%s: %d queries, %d rows, %.2f ms in the database",
+                path, stats.queries, stats.rows, stats.db_seconds * 1000,
+                extra={"db_queries": stats.queries, "db_rows": stats.rows, "db_seconds": stats.db_seconds},
+            )
+            if self.repeat_threshold > 0:
+                for shape, count in stats.repeated(self.repeat_threshold):
+                    logger.warning("%s: possible N+1, %d executions of %s", path, count, shape)
@@ -0,0 +1,167 @@
+"""Rate limits and a concurrency cap for the write endpoints.
+
+Every limit is a token bucket of `burst` tokens refilled at `rate` per
+second. A bucket is stored as the time its next token is due (GCRA, the
+"theoretical arrival time"), so taking a token is one comparison and
+one write, also in the database.
+
+With RATE_LIMIT_BACKEND="memory" every worker has its own buckets. The
+global limit is divided by WEB_CONCURRENCY, as all clients together are
+spread over the workers. The per-user and per-poll limits are whole in
+every worker: keep-alive pins a client to one worker, so a share would
+throttle it far below the setting, and a client spread over several
+workers gets up to WEB_CONCURRENCY times the limit instead. "database"
+keeps the buckets in the rate_limit_buckets table, shared by all workers
+and servers and exact, at the cost of a small write transaction per
+limited request.
+"""
+import asyncio
+import math
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from sqlalchemy import case, delete
+
+from .config import settings
+from .crud import dialect_insert
+from .database import pool_options, sessionmanager
+from .models.models import RateLimitBucketModel
+
+
+@dataclass(frozen=True, slots=True)
+class Limit:
+    rate: float # tokens per second
+    burst: int # bucket size, requests allowed at once after a quiet period
+
+    @property
+    def interval(self) -> float:
+        return 1 / self.rate
+
+    def admit(self, tat: float, now: float) -> tuple[float, float]:
+        """Takes a token from the bucket due at `tat`. Returns the new `tat`
+        and 0, or the unchanged `tat` and the seconds until a token is free."""
+        new_tat = max(tat, now) + self.interval
+        wait = new_tat - now - self.burst * self.interval
+        if wait > 0:
+            return tat, wait
+        return new_tat, 0.0
+
+
+class MemoryBuckets:
+    """Buckets of this worker, the least recently used are dropped (i.e.
+    refilled) beyond `maxsize`."""
+
+    def __init__(self, maxsize: int = 10_000):
+        self._maxsize = maxsize
+        self._tats: OrderedDict[str, float] = OrderedDict()
+
+    async def take(self, key: str, limit: Limit) -> float:
+        now = time.monotonic()
+        tat, wait = limit.admit(self._tats.get(key, now), now)
+        self._tats[key] = tat
+        self._tats.move_to_end(key)
+        while len(self._tats) > self._maxsize:
+            self._tats.popitem(last=False)
+        return wait
+
+
+class DatabaseBuckets:
+    """Buckets in the rate_limit_buckets table, taken with one upsert that
+    runs the `Limit.admit` comparison in SQL."""
+
+    # full buckets are deleted every this many takes of a worker
+    PRUNE_EVERY = 1000
+
+    def __init__(self):
+        self._takes = 0
+
+    async def take(self, key: str, limit: Limit) -> float:
+        now = time.time()
+        bucket = RateLimitBucketModel
+        new_tat = case((bucket.tat > now, bucket.tat), else_=now) + limit.interval
+        allowed = new_tat - now <= limit.burst * limit.interval
+        async with sessionmanager.session() as session:
+            row = (await session.execute(
+                dialect_insert(session, RateLimitBucketModel)
+                .values(key=key, tat=now + limit.interval, allowed=True)
+                .on_conflict_do_update(
+                    index_elements=["key"],
+                    set_={"tat": case((allowed, new_tat), else_=bucket.tat), "allowed": allowed},
+                )
+                .returning(bucket.tat, bucket.allowed)
+            )).one()
+            self._takes += 1
+            if self._takes % self.PRUNE_EVERY == 0:
+                await session.execute(delete(bucket).where(bucket.tat < now))
+            await session.commit()
+        if row.allowed:
+            return 0.0
+        return row.tat + limit.interval - now - limit.burst * limit.interval
+
+
+class RateLimiter:
+    def __init__(self, buckets: MemoryBuckets | DatabaseBuckets):
+        self._buckets = buckets
+
+    async def check(self, *scopes: tuple[str, Limit | None]) -> int:
+        """Takes a token from every (key, limit) bucket, skipping limits
+        that are off. Returns 0 when all of them had one, or else the
+        seconds to wait (Retry-After). Tokens taken before a rejection
+        are not given back."""
+        wait = 0.0
+        for key, limit in scopes:
+            if limit is not None:
+                wait = max(wait, await self._buckets.take(key, limit))
+        return math.ceil(wait)
+
+
+class WriteGate:
+    """At most `limit` writes of this worker at once, further ones wait up
+    to `timeout` seconds for a slot and are then rejected. Keeps a burst
+    from queueing on the connection pool until DB_POOL_TIMEOUT, which
+    would also stall the reads."""
+
+    def __init__(self, limit: int, timeout: float):
+        self.timeout = timeout
+        self._semaphore = asyncio.Semaphore(limit) if limit > 0 else None
+
+    async def acquire(self) -> bool:
+        if self._semaphore is None:
+            return True
+        if not self._semaphore.locked():
+            await self._semaphore.acquire()
+            return True
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.timeout)
+        except TimeoutError:
+            return False
+        return True
+
+    def release(self) -> None:
+        if self._semaphore is not None:
+            self._semaphore.release()
+
+
+def make_limit(rate: float, burst: int, shared: bool = False) -> Limit | None:
+    """Limit of the RATE_LIMIT_* settings, None when off. With the memory
+    backend a `shared` limit, taken by the requests of all workers, gets
+    this worker's share."""
+    if not settings.RATE_LIMIT_ENABLED or rate <= 0:
+        return None
+    if shared and settings.RATE_LIMIT_BACKEND == "memory":
+        rate /= settings.WEB_CONCURRENCY
+        burst = max(1, burst // settings.WEB_CONCURRENCY)
+    return Limit(rate, burst)
+
+
+USER_LIMIT = make_limit(settings.RATE_LIMIT_USER_PER_SECOND, settings.RATE_LIMIT_USER_BURST)
+POLL_LIMIT = make_limit(settings.RATE_LIMIT_POLL_PER_SECOND, settings.RATE_LIMIT_POLL_BURST)
+GLOBAL_LIMIT = make_limit(settings.RATE_LIMIT_GLOBAL_PER_SECOND, settings.RATE_LIMIT_GLOBAL_BURST, shared=True)
+
+rate_limiter = RateLimiter(DatabaseBuckets() if settings.RATE_LIMIT_BACKEND == "database" else MemoryBuckets())
+
+# by default the writes may use the steady pool, the overflow stays for the reads
+write_gate = WriteGate(
+    settings.WRITE_MAX_CONCURRENCY or pool_options()["pool_size"], settings.WRITE_QUEUE_TIMEOUT
+)
@@ -56,6 +56,7 @@ class PollExtendedSchema(PollBaseSchema):
 
 class PollPublicSchema(PollExtendedSchema, IntMixinSchema):
     options: list["OptionPublicSchema"] = conlist("OptionBaseSchema", min_length=1)
+    closed_at: datetime | None = None
 
 class PollCreateSchema(PollBaseSchema):
     options: list["OptionCreateSchema"] = conlist("OptionBaseSchema", min_length=1)
@@ -63,6 +64,7 @@ class PollCreateSchema(PollBaseSchema):
 class PollsPublicSchema(BaseSchema):
     data: list[PollPublicSchema]
     count: int
+    next_cursor: str | None = None
 
 
 class OptionBaseSchema(BaseSchema):
@@ -74,6 +76,13 @@ class OptionPublicSchema(OptionBaseSchema, UUIDMixinSchema):
 class OptionCreateSchema(OptionBaseSchema):
     pass
 
+class OptionResultSchema(OptionPublicSchema):
+    votes_count: int
+
+class PollResultsSchema(BaseSchema):
+    poll_id: int
+    options: list[OptionResultSchema]
+
 
 
 
@@ -85,8 +94,23 @@ class VotePublicSchema(VoteBaseSchema, UUIDMixinSchema):
     selected_options: list["OptionPublicSchema"] = conlist("OptionBaseSchema", min_length=1)
 
 class VoteCreateSchema(VoteBaseSchema):
-    selected_options: list["UUID"] = conlist("OptionBaseSchema", min_length=1)
+    selected_options: conlist(UUID, min_length=1)
+
+class VoteBulkCreateSchema(VoteCreateSchema):
+    voter_id: EmailStr
+
+class VoteBulkResultSchema(BaseSchema):
+    index: int
+    accepted: bool
+    id: UUID | None = None
+    detail: str | None = None
+
+class VotesBulkResultSchema(BaseSchema):
+    data: list[VoteBulkResultSchema]
+    accepted: int
+    rejected: int
 
 class VotesPublicSchema(BaseSchema):
     data: list[VotePublicSchema]
-    count: int
\ No newline at end of file
+    count: int
+    next_cursor: str | None = None
\ No newline at end of file
@@ -0,0 +1,69 @@
+"""Fast path of the list endpoints (FAST_SERIALIZATION).
+
+Instead of loading ORM objects, validating them into the response schema
+and letting FastAPI validate the result once more for `response_model`,
+the rows are read as plain tuples, grouped into dicts and encoded to
+JSON in one go. The responses have the same fields as the schemas.
+`python -m benchmarks.serialization` compares both paths.
+"""
+from typing import Any, Sequence
+
+from fastapi import Response
+from pydantic_core import to_json
+from sqlalchemy import Row, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .models.models import OptionModel, VoteOptionLinksModel
+
+try:
+    import orjson
+except ImportError:  # "performance" dependency group
+    orjson = None
+
+
+def dumps(content: Any) -> bytes:
+    """JSON of dicts, lists, UUIDs and datetimes."""
+    if orjson is not None:
+        # "Z" like pydantic for UTC datetimes
+        return orjson.dumps(content, option=orjson.OPT_UTC_Z)
+    return to_json(content)
+
+
+class FastJSONResponse(Response):
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+async def polls_with_options(session: AsyncSession, polls: Sequence[Row]) -> list[dict]:
+    """PollPublicSchema-shaped dicts of poll rows, with their options
+    read in one query."""
+    data = {}
+    for poll in polls:
+        data[poll.id] = poll._asdict() | {"options": []}
+    if data:
+        rows = await session.execute(
+            select(OptionModel.poll_id, OptionModel.id, OptionModel.title)
+            .where(OptionModel.poll_id.in_(list(data)))
+        )
+        for poll_id, option_id, title in rows:
+            data[poll_id]["options"].append({"id": option_id, "title": title})
+    return list(data.values())
+
+
+async def votes_with_options(session: AsyncSession, votes: Sequence[Row]) -> list[dict]:
+    """VotePublicSchema-shaped dicts of vote rows, with their selected
+    options read in one query."""
+    data = {}
+    for vote in votes:
+        data[vote.id] = {"id": vote.id, "poll_id": vote.poll_id, "voter_id": vote.voter_id, "selected_options": []}
+    if data:
+        rows = await session.execute(
+            select(VoteOptionLinksModel.vote_id, OptionModel.id, OptionModel.title)
+            .join(OptionModel, OptionModel.id == VoteOptionLinksModel.option_id)
+            .where(VoteOptionLinksModel.vote_id.in_(list(data)))
+        )
+        for vote_id, option_id, title in rows:
+            data[vote_id]["selected_options"].append({"id": option_id, "title": title})
+    return list(data.values())
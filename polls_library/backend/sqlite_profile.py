@@ -0,0 +1,68 @@
+"""SQLite tuning for single node installs (DEBUG_USE_SQLITE).
+
+SQLite allows one writer at a time. Without help, concurrent votes
+spin in the busy handler and fail with "database is locked" after the
+timeout. With WAL, readers no longer block on the writer, and the
+writer lock below makes the writers of a worker queue up in asyncio
+instead of the busy handler. busy_timeout then only covers the other
+workers.
+"""
+import asyncio
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.util import await_only
+
+from .config import settings
+
+WRITE_STATEMENTS = ("INSERT", "UPDATE", "DELETE", "REPLACE")
+
+
+def apply_profile(engine: AsyncEngine) -> None:
+    """Sets the SQLITE_* pragmas on every new connection of `engine`."""
+    pragmas = {
+        "journal_mode": "WAL",
+        "synchronous": settings.SQLITE_SYNCHRONOUS,
+        "busy_timeout": settings.SQLITE_BUSY_TIMEOUT_MS,
+        "mmap_size": settings.SQLITE_MMAP_SIZE,
+        # negative: in KiB instead of pages
+        "cache_size": -settings.SQLITE_CACHE_SIZE_KB,
+        "temp_store": "MEMORY",
+        "foreign_keys": "ON",
+    }
+
+    @event.listens_for(engine.sync_engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+
+class SingleWriter:
+    """Lets one connection of `engine` at a time write, the others wait
+    for it in FIFO order. Reads are not affected.
+
+    The lock is taken before the first INSERT/UPDATE/DELETE of a
+    transaction and released when the connection goes back to the pool,
+    i.e. after the COMMIT or ROLLBACK. pysqlite only opens the
+    transaction right before that first write, so earlier reads never
+    hold a snapshot that the write would have to upgrade.
+    """
+
+    def __init__(self):
+        self._lock = asyncio.Lock()
+
+    def install(self, engine: AsyncEngine) -> None:
+        @event.listens_for(engine.sync_engine, "before_cursor_execute")
+        def acquire(conn, cursor, statement, parameters, context, executemany):
+            if "writer" in conn.info or not statement.lstrip()[:7].upper().startswith(WRITE_STATEMENTS):
+                return
+            # runs inside SQLAlchemy's greenlet, so the event loop can be awaited
+            await_only(self._lock.acquire())
+            conn.info["writer"] = True
+
+        @event.listens_for(engine.sync_engine.pool, "checkin")
+        def release(dbapi_connection, connection_record):
+            if connection_record is not None and connection_record.info.pop("writer", False):
+                self._lock.release()
@@ -0,0 +1,97 @@
+from uuid import UUID
+
+from sqlalchemy import func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .models.models import OptionModel, PollModel, VoteOptionLinksModel
+
+
+async def change_tallies(
+    session: AsyncSession,
+    option_ids: list[UUID],
+    amount: int = 1,
+) -> dict[UUID, int]:
+    """Adds `amount` to the vote counters of the given options and returns
+    their new values.
+
+    Does not commit, so the counters change in the same transaction
+    as the vote itself.
+    """
+    if not option_ids:
+        return {}
+    rows = await session.execute(
+        update(OptionModel)
+        .where(OptionModel.id.in_(option_ids))
+        .values(votes_count=OptionModel.votes_count + amount)
+        .returning(OptionModel.id, OptionModel.votes_count)
+        .execution_options(synchronize_session=False)
+    )
+    return dict(rows.all())
+
+
+async def change_tallies_many(
+    session: AsyncSession,
+    amounts: dict[UUID, int],
+) -> dict[UUID, int]:
+    """Like `change_tallies` with a different amount per option, one
+    statement per distinct amount."""
+    by_amount: dict[int, list[UUID]] = {}
+    for option_id, amount in amounts.items():
+        by_amount.setdefault(amount, []).append(option_id)
+    counts = {}
+    for amount, option_ids in by_amount.items():
+        counts |= await change_tallies(session, option_ids, amount)
+    return counts
+
+
+async def read_tallies(session: AsyncSession, poll_id: int, with_closed_at: bool = False):
+    """Returns (id, title, votes_count) rows for every option of a poll,
+    with `with_closed_at` also the poll's closed_at in every row."""
+    query = (
+        select(OptionModel.id, OptionModel.title, OptionModel.votes_count)
+        .where(OptionModel.poll_id == poll_id)
+    )
+    if with_closed_at:
+        query = query.add_columns(PollModel.closed_at).join(PollModel, PollModel.id == OptionModel.poll_id)
+    rows = await session.execute(query)
+    return rows.all()
+
+
+async def recount_tallies(session: AsyncSession, poll_id: int | None = None) -> int:
+    """Rebuilds the option counters from `vote_option_links`.
+
+    Args:
+        session (AsyncSession): SQLAlchemy async session
+        poll_id (int, optional): only recount options of this poll.
+            Defaults to None (every option).
+
+    Returns:
+        int: number of options recounted
+    """
+    counted = (
+        select(func.count(VoteOptionLinksModel.vote_id))
+        .where(VoteOptionLinksModel.option_id == OptionModel.id)
+        .scalar_subquery()
+    )
+    query = update(OptionModel).values(votes_count=counted)
+    if poll_id is not None:
+        query = query.where(OptionModel.poll_id == poll_id)
+
+    rows = await session.execute(query.execution_options(synchronize_session=False))
+    await session.commit()
+    return rows.rowcount
+
+
+if __name__ == '__main__':
+    # python -m backend.tallies [poll_id]
+    import asyncio
+    import sys
+
+    from .database import sessionmanager
+
+    async def recount(poll_id: int | None):
+        async with sessionmanager.session() as session:
+            print(f"Recounted {await recount_tallies(session, poll_id)} options")
+        await sessionmanager.close()
+
+    asyncio.run(recount(int(sys.argv[1]) if len(sys.argv) > 1 else None))
@@ -0,0 +1,144 @@
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from uuid import UUID
+
+from .config import settings
+from .crud import copy_insert, dialect_insert
+from .database import sessionmanager
+from .live import publish_tallies
+from .models.models import VoteModel, VoteOptionLinksModel
+from .tallies import change_tallies_many
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(slots=True)
+class PendingVote:
+    id: UUID
+    voter_id: str
+    poll_id: int
+    option_ids: list[UUID]
+    committed: asyncio.Future = field(default_factory=lambda: asyncio.get_running_loop().create_future())
+
+
+class VoteBuffer:
+    """Write-behind queue that commits accepted votes in batches.
+
+    Each worker collects votes until `max_size` are waiting or `max_delay`
+    seconds passed since the first one, then writes the whole batch in one
+    transaction. Callers await the batch's commit, so a vote is only
+    acknowledged once it is durable, like with a commit per request.
+    """
+
+    def __init__(self, max_size: int, max_delay: float):
+        self._max_size = max_size
+        self._max_delay = max_delay
+        self._queue: asyncio.Queue[PendingVote | None] | None = None
+        self._task: asyncio.Task | None = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self) -> None:
+        self._queue = asyncio.Queue(maxsize=self._max_size * 10)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Commits whatever is still queued and stops the flusher."""
+        if not self.running:
+            return
+        await self._queue.put(None)
+        await self._task
+
+    async def submit(self, vote_id: UUID, voter_id: str, poll_id: int, option_ids: list[UUID]) -> bool:
+        """Queues a validated vote and waits for its batch to commit.
+
+        Returns:
+            bool: True if the vote was stored, False if the voter already
+                voted in this poll
+        """
+        vote = PendingVote(vote_id, voter_id, poll_id, option_ids)
+        await self._queue.put(vote)
+        return await vote.committed
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            vote = await self._queue.get()
+            if vote is None:
+                return
+            batch = [vote]
+            deadline = loop.time() + self._max_delay
+            while len(batch) < self._max_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    vote = await asyncio.wait_for(self._queue.get(), timeout)
+                except TimeoutError:
+                    break
+                if vote is None:
+                    stopping = True
+                    break
+                batch.append(vote)
+            await self._flush(batch)
+
+    async def _flush(self, batch: list[PendingVote]) -> None:
+        if len(batch) == 1:
+            await self._flush_one(batch[0])
+            return
+        try:
+            inserted = await self._write(batch)
+        except Exception:
+            # one bad row (e.g. its poll was deleted meanwhile) must not fail
+            # the other voters, so the votes are retried one at a time
+            logger.exception("Vote batch of %d failed, retrying the votes one by one", len(batch))
+            for vote in batch:
+                await self._flush_one(vote)
+            return
+        for vote in batch:
+            if not vote.committed.done():
+                vote.committed.set_result(vote.id in inserted)
+
+    async def _flush_one(self, vote: PendingVote) -> None:
+        try:
+            inserted = await self._write([vote])
+        except Exception as e:
+            logger.exception("Vote %s failed", vote.id)
+            if not vote.committed.done():
+                vote.committed.set_exception(e)
+            return
+        if not vote.committed.done():
+            vote.committed.set_result(vote.id in inserted)
+
+    async def _write(self, batch: list[PendingVote]) -> set[UUID]:
+        """Commits the votes in one transaction, rolled back if any of them
+        fails. Returns the ids of the inserted ones, the others were
+        duplicates."""
+        async with sessionmanager.session() as session:
+            inserted = set((await session.scalars(
+                dialect_insert(session, VoteModel)
+                .on_conflict_do_nothing(index_elements=["voter_id", "poll_id"])
+                .returning(VoteModel.id),
+                [{"id": vote.id, "voter_id": vote.voter_id, "poll_id": vote.poll_id} for vote in batch],
+            )).all())
+            link_rows, amounts, polls = [], {}, {}
+            for vote in batch:
+                if vote.id not in inserted:
+                    continue
+                for option_id in vote.option_ids:
+                    link_rows.append({"vote_id": vote.id, "option_id": option_id})
+                    amounts[option_id] = amounts.get(option_id, 0) + 1
+                    polls.setdefault(vote.poll_id, set()).add(option_id)
+            await copy_insert(session, VoteOptionLinksModel, link_rows)
+            counts = await change_tallies_many(session, amounts)
+            for poll_id, option_ids in polls.items():
+                await publish_tallies(session, poll_id, {option_id: counts[option_id] for option_id in option_ids})
+            await session.commit()
+        return inserted
+
+
+vote_buffer = VoteBuffer(settings.VOTE_BATCH_SIZE, settings.VOTE_BATCH_DELAY_MS / 1000)
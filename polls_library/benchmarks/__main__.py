@@ -0,0 +1,126 @@
+"""HTTP benchmarks of the API.
+
+Run from polls_library/ (templates are loaded relative to it), with the
+same .env/environment as the app. The database picked by the settings is
+used, so point it at a scratch database: DEBUG_USE_SQLITE=true for SQLite,
+DEBUG_USE_SQLITE=false for Postgres. The write rate limits apply too, set
+RATE_LIMIT_ENABLED=false unless they are what is measured.
+
+    python -m benchmarks --json before.json
+    python -m benchmarks --url http://localhost:8000 --concurrency 50
+
+Seeded rows belong to bench-<run id>-* users and are deleted afterwards
+unless --keep is given.
+"""
+import argparse
+import asyncio
+import platform
+import subprocess
+import sys
+from uuid import uuid4
+
+import httpx
+
+from backend.config import settings
+from backend.database import sessionmanager
+
+from .runner import cleanup, format_table, run_scenario, seed, session_cookie, to_json
+
+SCENARIOS = ["create_vote", "read_polls", "read_votes_by_poll", "users_votes", "frontend_polls"]
+
+
+def parse_args(argv: list[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="benchmark a running server instead of the app in-process")
+    parser.add_argument("--requests", type=int, default=500, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--polls", type=int, default=200)
+    parser.add_argument("--options", type=int, default=5, help="options per poll")
+    parser.add_argument("--votes", type=int, default=100, help="seeded votes per poll")
+    parser.add_argument("--scenario", action="append", choices=SCENARIOS,
+                        help="only run these scenarios (repeatable)")
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--keep", action="store_true", help="keep the seeded rows")
+    return parser.parse_args(argv)
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def main(args: argparse.Namespace) -> None:
+    from backend.main import app
+
+    api = settings.API_V1_STR
+    if args.url:
+        transport, base_url = None, args.url
+    else:
+        # https, or HTTPSRedirectMiddleware answers every request with a redirect
+        transport, base_url = httpx.ASGITransport(app=app), "https://localhost"
+
+    async with app.router.lifespan_context(app):
+        dataset = await seed(
+            uuid4().hex[:8], args.users, args.polls, args.options, args.votes, args.concurrency
+        )
+        clients = [
+            httpx.AsyncClient(
+                transport=transport, base_url=base_url, timeout=60,
+                cookies={"session": session_cookie(voter)},
+            )
+            for voter in dataset.voters
+        ]
+        requests = {
+            "create_vote": lambda client, worker, i: client.post(f"{api}/votes/", json={
+                "poll_id": dataset.polls[i % len(dataset.polls)],
+                "selected_options": dataset.options[dataset.polls[i % len(dataset.polls)]][:1],
+            }),
+            "read_polls": lambda client, worker, i: client.get(f"{api}/polls/"),
+            "read_votes_by_poll": lambda client, worker, i: client.get(
+                f"{api}/votes/polls/{dataset.polls[i % len(dataset.polls)]}"
+            ),
+            "users_votes": lambda client, worker, i: client.get(f"{api}/users/votes"),
+            "frontend_polls": lambda client, worker, i: client.get("/frontend/polls/1"),
+        }
+        results = []
+        try:
+            for name in args.scenario or SCENARIOS:
+                requests_count = args.requests
+                if name == "create_vote":
+                    # one vote per voter and poll
+                    requests_count = min(args.requests, len(dataset.polls) * len(clients))
+                result = await run_scenario(name, clients, requests_count, requests[name])
+                results.append(result)
+                print(f"{name}: {result.rps} req/s, p50 {result.p50_ms} ms, p99 {result.p99_ms} ms", file=sys.stderr)
+        finally:
+            for client in clients:
+                await client.aclose()
+            if not args.keep:
+                await cleanup(dataset)
+
+    print(format_table(results))
+    if args.json:
+        meta = {
+            "commit": git_commit(),
+            "database": sessionmanager.dialect_name,
+            "target": args.url or "in-process",
+            "python": platform.python_version(),
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "users": args.users,
+            "polls": args.polls,
+            "options": args.options,
+            "votes": args.votes,
+        }
+        with open(args.json, "w") as f:
+            f.write(to_json(results, meta))
+
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args(sys.argv[1:])))
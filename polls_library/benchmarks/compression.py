@@ -0,0 +1,106 @@
+"""Micro-benchmark of CompressionMiddleware's codecs, per response size.
+
+Compresses /votes/polls/{id}-shaped and /polls/-shaped JSON bodies of
+growing length with every installed codec at the COMPRESSION_* levels
+and prints the bytes on the wire and the CPU time per response. Doesn't
+touch the database. Run from polls_library/ like `python -m benchmarks`,
+other levels through the environment:
+
+    python -m benchmarks.compression --items 10 100 1000 10000
+    COMPRESSION_GZIP_LEVEL=1 python -m benchmarks.compression
+"""
+import argparse
+import sys
+import time
+from datetime import datetime, timezone
+from random import Random
+from uuid import UUID
+
+from backend.compression import available_encoders
+from backend.serialization import dumps
+
+from .runner import BENCH_DOMAIN
+
+
+def parse_args(argv: list[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.compression", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, nargs="+", default=[10, 100, 1000, 10000],
+                        help="list items per body, one run each")
+    parser.add_argument("--options", type=int, default=5, help="options per poll")
+    parser.add_argument("--seconds", type=float, default=0.5, help="minimum time per measurement")
+    return parser.parse_args(argv)
+
+
+def votes_page(rng: Random, items: int, options: int) -> bytes:
+    choices = [{"id": UUID(int=rng.getrandbits(128)), "title": f"Option {j}"} for j in range(options)]
+    return dumps({
+        "data": [
+            {
+                "id": UUID(int=rng.getrandbits(128)),
+                "poll_id": 1,
+                "voter_id": f"user-{i}@{BENCH_DOMAIN}",
+                "selected_options": [rng.choice(choices)],
+            }
+            for i in range(items)
+        ],
+        "count": items,
+        "next_cursor": None,
+    })
+
+
+def polls_page(rng: Random, items: int, options: int) -> bytes:
+    created_at = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    return dumps({
+        "data": [
+            {
+                "id": i,
+                "title": f"Poll {i}",
+                "description": None,
+                "multiple_choice": i % 2 == 0,
+                "anonymous": False,
+                "expires_at": None,
+                "author_id": f"author@{BENCH_DOMAIN}",
+                "created_at": created_at,
+                "closed_at": None,
+                "options": [
+                    {"id": UUID(int=rng.getrandbits(128)), "title": f"Option {j}"} for j in range(options)
+                ],
+            }
+            for i in range(items)
+        ],
+        "count": items,
+        "next_cursor": None,
+    })
+
+
+def per_call(function, body: bytes, seconds: float) -> float:
+    """Seconds per `function(body)`, repeated for at least `seconds`."""
+    calls, start = 0, time.perf_counter()
+    while True:
+        function(body)
+        calls += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= seconds:
+            return elapsed / calls
+
+
+def main(args: argparse.Namespace) -> None:
+    encoders = available_encoders()
+    rng = Random(0)
+    print(f"{'body':<8} {'items':>6} {'coding':<6} {'bytes':>10} {'ratio':>6} {'us/resp':>10} {'MB/s':>8}")
+    for name, build in (("votes", votes_page), ("polls", polls_page)):
+        for items in args.items:
+            body = build(rng, items, args.options)
+            print(f"{name:<8} {items:>6} {'-':<6} {len(body):>10} {1:>6.2f} {0:>10.1f} {'-':>8}")
+            for coding, encode in encoders.items():
+                size = len(encode(body))
+                seconds = per_call(encode, body, args.seconds)
+                print(
+                    f"{name:<8} {items:>6} {coding:<6} {size:>10} {size / len(body):>6.2f}"
+                    f" {seconds * 1e6:>10.1f} {len(body) / seconds / 1e6:>8.1f}"
+                )
+
+
+if __name__ == "__main__":
+    main(parse_args(sys.argv[1:]))
@@ -0,0 +1,54 @@
+"""Micro-benchmark of CrudFactory.create_instance on wide nested payloads.
+
+Builds (without committing) a poll with N options, the way POST /polls/
+does, and reports the cost per nested item. Doesn't touch the database.
+Run from polls_library/ like `python -m benchmarks`:
+
+    python -m benchmarks.crud --options 10 100 500
+"""
+import argparse
+import asyncio
+import sys
+import time
+
+from backend.crud import CrudFactory
+from backend.database import sessionmanager
+from backend.models.models import PollModel
+
+
+def parse_args(argv: list[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.crud", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--options", type=int, nargs="+", default=[10, 100, 500],
+                        help="options per poll, one run each")
+    parser.add_argument("--rounds", type=int, default=50, help="polls built per run")
+    return parser.parse_args(argv)
+
+
+def payload(options: int) -> dict:
+    return {
+        "title": "Bench poll",
+        "description": None,
+        "multiple_choice": False,
+        "anonymous": False,
+        "expires_at": None,
+        "author_id": "bench@bench.example.com",
+        "options": [{"title": f"Option {i}"} for i in range(options)],
+    }
+
+
+async def main(args: argparse.Namespace) -> None:
+    print(f"{'options':>8} {'ms/poll':>9} {'us/item':>9}")
+    async with sessionmanager.session() as session:
+        for options in args.options:
+            data = payload(options)
+            await CrudFactory(PollModel).create_instance(session, data, False)  # warm up
+            start = time.perf_counter()
+            for _ in range(args.rounds):
+                await CrudFactory(PollModel).create_instance(session, data, False)
+            seconds = (time.perf_counter() - start) / args.rounds
+            print(f"{options:>8} {seconds * 1000:>9.2f} {seconds / (options + 1) * 1e6:>9.1f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args(sys.argv[1:])))
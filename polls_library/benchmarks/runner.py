@@ -0,0 +1,200 @@
+import asyncio
+import json
+import statistics
+import time
+from base64 import b64encode
+from dataclasses import asdict, dataclass
+from random import Random
+from typing import Awaitable, Callable
+from uuid import uuid4
+
+import httpx
+from itsdangerous import TimestampSigner
+from sqlalchemy import delete, insert
+
+from backend.config import settings
+from backend.database import sessionmanager
+from backend.models.models import (
+    OptionModel,
+    PollModel,
+    UserModel,
+    VoteModel,
+    VoteOptionLinksModel,
+)
+from backend.tallies import recount_tallies
+
+# special-use TLDs like .test are rejected by EmailStr in the response schemas
+BENCH_DOMAIN = "bench.example.com"
+
+
+def session_cookie(email: str) -> str:
+    """Signed `session` cookie as SessionMiddleware writes it after /auth,
+    so the benchmark doesn't go through Google OAuth."""
+    data = b64encode(json.dumps({"user": {"email": email}}).encode("utf-8"))
+    return TimestampSigner(str(settings.SECRET_KEY)).sign(data).decode("utf-8")
+
+
+@dataclass
+class Dataset:
+    run_id: str
+    users: list[str]
+    polls: list[int]
+    options: dict[int, list[str]]
+    voters: list[str]
+
+
+async def seed(
+    run_id: str,
+    users: int,
+    polls: int,
+    options_per_poll: int,
+    votes_per_poll: int,
+    voters: int,
+    seed: int = 0,
+) -> Dataset:
+    """Inserts users, polls with options and votes with Core executemany.
+
+    `voters` extra users don't vote during seeding, they cast the votes
+    of the create_vote scenario.
+    """
+    rng = Random(seed)
+    user_ids = [f"bench-{run_id}-{i}@{BENCH_DOMAIN}" for i in range(users)]
+    voter_ids = [f"bench-{run_id}-voter-{i}@{BENCH_DOMAIN}" for i in range(voters)]
+    async with sessionmanager.session() as session:
+        await session.execute(
+            insert(UserModel),
+            [{"id": user_id, "is_superuser": i == 0} for i, user_id in enumerate(user_ids + voter_ids)],
+        )
+        poll_ids = list(await session.scalars(
+            insert(PollModel).returning(PollModel.id),
+            [
+                {"title": f"Bench poll {i}", "author_id": user_ids[0], "multiple_choice": i % 2 == 0}
+                for i in range(polls)
+            ],
+        ))
+        option_rows = [
+            {"id": uuid4(), "poll_id": poll_id, "title": f"Option {j}"}
+            for poll_id in poll_ids
+            for j in range(options_per_poll)
+        ]
+        await session.execute(insert(OptionModel), option_rows)
+        options: dict[int, list] = {}
+        for row in option_rows:
+            options.setdefault(row["poll_id"], []).append(row["id"])
+
+        vote_rows, link_rows = [], []
+        for poll_id in poll_ids:
+            for user_id in rng.sample(user_ids, min(votes_per_poll, users)):
+                vote_id = uuid4()
+                option_id = rng.choice(options[poll_id])
+                vote_rows.append({"id": vote_id, "voter_id": user_id, "poll_id": poll_id})
+                link_rows.append({"vote_id": vote_id, "option_id": option_id})
+        if vote_rows:
+            await session.execute(insert(VoteModel), vote_rows)
+            await session.execute(insert(VoteOptionLinksModel), link_rows)
+        await session.commit()
+    async with sessionmanager.session() as session:
+        await recount_tallies(session)
+    return Dataset(
+        run_id=run_id,
+        users=user_ids,
+        polls=poll_ids,
+        options={poll_id: [str(o) for o in ids] for poll_id, ids in options.items()},
+        voters=voter_ids,
+    )
+
+
+async def cleanup(dataset: Dataset) -> None:
+    # polls, options and votes go with their users through ON DELETE CASCADE
+    async with sessionmanager.session() as session:
+        await session.execute(delete(UserModel).where(UserModel.id.in_(dataset.users + dataset.voters)))
+        await session.commit()
+
+
+@dataclass
+class Result:
+    name: str
+    requests: int
+    concurrency: int
+    errors: int
+    seconds: float
+    rps: float
+    mean_ms: float
+    p50_ms: float
+    p95_ms: float
+    p99_ms: float
+    max_ms: float
+    bytes_per_response: float
+
+
+Request = Callable[[httpx.AsyncClient, int, int], Awaitable[httpx.Response]]
+
+
+async def run_scenario(
+    name: str,
+    clients: list[httpx.AsyncClient],
+    requests: int,
+    request: Request,
+    expected: tuple[int, ...] = (200,),
+) -> Result:
+    """Sends `requests` requests spread over one worker per client and
+    measures the latency of each one.
+
+    Args:
+        name (str): scenario name in the report
+        clients (list[httpx.AsyncClient]): one client (and user) per
+            concurrent worker
+        requests (int): total number of requests
+        request (Request): coroutine function sending request number
+            `iteration` of worker `worker` with `client`
+        expected (tuple[int, ...], optional): status codes counted as success.
+            Defaults to (200,).
+    """
+    latencies: list[float] = []
+    sizes: list[int] = []
+    errors = 0
+    per_worker = max(1, requests // len(clients))
+
+    async def worker(index: int, client: httpx.AsyncClient):
+        nonlocal errors
+        for iteration in range(per_worker):
+            start = time.perf_counter()
+            response = await request(client, index, iteration)
+            latencies.append(time.perf_counter() - start)
+            sizes.append(len(response.content))
+            if response.status_code not in expected:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(i, client) for i, client in enumerate(clients)))
+    seconds = time.perf_counter() - start
+
+    cuts = statistics.quantiles(latencies, n=100, method="inclusive") if len(latencies) > 1 else latencies * 99
+    return Result(
+        name=name,
+        requests=len(latencies),
+        concurrency=len(clients),
+        errors=errors,
+        seconds=round(seconds, 3),
+        rps=round(len(latencies) / seconds, 1),
+        mean_ms=round(statistics.fmean(latencies) * 1000, 2),
+        p50_ms=round(cuts[49] * 1000, 2),
+        p95_ms=round(cuts[94] * 1000, 2),
+        p99_ms=round(cuts[98] * 1000, 2),
+        max_ms=round(max(latencies) * 1000, 2),
+        bytes_per_response=round(statistics.fmean(sizes), 1),
+    )
+
+
+def format_table(results: list[Result]) -> str:
+    header = f"{'scenario':<20}{'req':>7}{'err':>5}{'rps':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'bytes':>10}"
+    lines = [header, "-" * len(header)]
+    for r in results:
+        lines.append(
+            f"{r.name:<20}{r.requests:>7}{r.errors:>5}{r.rps:>9}{r.p50_ms:>9}{r.p95_ms:>9}{r.p99_ms:>9}{r.bytes_per_response:>10}"
+        )
+    return "\n".join(lines)
+
+
+def to_json(results: list[Result], meta: dict) -> str:
+    return json.dumps({"meta": meta, "results": {r.name: asdict(r) for r in results}}, indent=2)
@@ -0,0 +1,113 @@
+"""Micro-benchmark of the list endpoints' serialization, per item.
+
+Compares the default path (SQLAlchemy models, validated into the response
+schema, serialized by FastAPI or conditional_response) with the
+FAST_SERIALIZATION one (plain rows, dicts, one dumps) on a page of polls
+and a page of votes. Run from polls_library/ like `python -m benchmarks`:
+
+    python -m benchmarks.serialization --rounds 50
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+from typing import Awaitable, Callable
+from uuid import uuid4
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.routing import serialize_response
+from fastapi.utils import create_model_field
+
+from backend.config import settings
+from backend.crud import CrudFactory, encode_cursor
+from backend.database import sessionmanager
+from backend.models.models import PollModel, VoteModel
+from backend.schemas.schemas import PollsPublicSchema, VotesPublicSchema
+from backend.serialization import dumps, polls_with_options, votes_with_options
+
+from .runner import cleanup, seed
+
+PollCrud = CrudFactory(PollModel)
+VoteCrud = CrudFactory(VoteModel)
+
+
+def parse_args(argv: list[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.serialization", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", type=int, default=50, help="pages serialized per path")
+    parser.add_argument("--options", type=int, default=5, help="options per poll")
+    parser.add_argument("--keep", action="store_true", help="keep the seeded rows")
+    return parser.parse_args(argv)
+
+
+async def timed(rounds: int, page: Callable[[], Awaitable[bytes]]) -> tuple[float, bytes]:
+    """Seconds per call of `page`, and its last body."""
+    body = await page()  # warm up
+    start = time.perf_counter()
+    for _ in range(rounds):
+        body = await page()
+    return (time.perf_counter() - start) / rounds, body
+
+
+async def main(args: argparse.Namespace) -> None:
+    from backend.main import app
+
+    limit = settings.BACKEND_PAGINATION_AMOUNT
+    votes_field = create_model_field("response", VotesPublicSchema)
+
+    async with app.router.lifespan_context(app):
+        # a full page of votes on the first poll
+        dataset = await seed(uuid4().hex[:8], limit, limit, args.options, limit, 0)
+        poll_id = dataset.polls[0]
+        # the seeded polls, even if the database isn't empty
+        after = {"cursor": encode_cursor(dataset.polls[0] - 1)}
+
+        async def polls_default() -> bytes:
+            async with sessionmanager.session() as session:
+                data, _ = await PollCrud.read_many(session, limit=limit, load="poll_with_options", order_by="id", **after)
+                # read_polls -> conditional_response
+                content = PollsPublicSchema(data=data, count=len(data))
+                return PollsPublicSchema.model_validate(content).model_dump_json().encode()
+
+        async def polls_fast() -> bytes:
+            async with sessionmanager.session() as session:
+                data, _ = await PollCrud.read_many(session, limit=limit, order_by="id", as_rows=True, **after)
+                return dumps({"data": await polls_with_options(session, data), "count": len(data), "next_cursor": None})
+
+        async def votes_default() -> bytes:
+            async with sessionmanager.session() as session:
+                data, _ = await VoteCrud.read_many(
+                    session, [poll_id], column="poll_id", limit=limit, load="vote_with_options", order_by="id"
+                )
+                # response_model validation, then JSONResponse.render
+                content = await serialize_response(
+                    field=votes_field, response_content=VotesPublicSchema(data=data, count=len(data)),
+                    is_coroutine=True,
+                )
+                return json.dumps(jsonable_encoder(content), separators=(",", ":")).encode()
+
+        async def votes_fast() -> bytes:
+            async with sessionmanager.session() as session:
+                data, _ = await VoteCrud.read_many(
+                    session, [poll_id], column="poll_id", limit=limit, order_by="id", as_rows=True
+                )
+                return dumps({"data": await votes_with_options(session, data), "count": len(data), "next_cursor": None})
+
+        print(f"{'page':<8} {'path':<8} {'items':>6} {'ms/page':>9} {'us/item':>9}")
+        try:
+            for name, default, fast in (("polls", polls_default, polls_fast), ("votes", votes_default, votes_fast)):
+                seconds, body = await timed(args.rounds, default)
+                items = len(json.loads(body)["data"])
+                fast_seconds, fast_body = await timed(args.rounds, fast)
+                if json.loads(fast_body)["data"] != json.loads(body)["data"]:
+                    print(f"{name}: the fast path returned different data", file=sys.stderr)
+                for path, s in (("default", seconds), ("fast", fast_seconds)):
+                    print(f"{name:<8} {path:<8} {items:>6} {s * 1000:>9.2f} {s / items * 1e6:>9.1f}")
+        finally:
+            if not args.keep:
+                await cleanup(dataset)
+
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args(sys.argv[1:])))
@@ -16,7 +16,12 @@ exec uvicorn backend.main:app --host $BACKEND_HOST --reload --port $BACKEND_PORT
 elif [ "$ENVIRONMENT" = "PROD" ]; then
 
 color_print "Starting production server"
-exec gunicorn --bind 0.0.0.0:8000 backend.main:app --workers $(($(nproc) * 2 + 1)) --timeout 1600 -k uvicorn.workers.UvicornWorker
+# workers write their metrics here, /metrics aggregates them (backend/metrics.py)
+export PROMETHEUS_MULTIPROC_DIR=${PROMETHEUS_MULTIPROC_DIR:-/tmp/prometheus}
+rm -rf "$PROMETHEUS_MULTIPROC_DIR" && mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+# also read by the app to split DB_CONNECTION_BUDGET between the workers
+export WEB_CONCURRENCY=${WEB_CONCURRENCY:-$(($(nproc) * 2 + 1))}
+exec gunicorn --bind 0.0.0.0:8000 backend.main:app --workers $WEB_CONCURRENCY --timeout 1600 -k uvicorn.workers.UvicornWorker
 
 fi
 
@@ -0,0 +1,7 @@
+# loaded by gunicorn from the working directory, next to the flags in docker-entrypoint.sh
+
+
+def child_exit(server, worker):
+    # drop the live gauges of dead workers from the /metrics aggregation
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)